@@ -1,5 +1,9 @@
 import sys
 import io
+import time
+
+# Everything in the startup profile is measured from here
+STARTUP_STARTED = time.perf_counter()
 
 # Safe print function that works without console
 def safe_print(*args, **kwargs):
@@ -20,22 +24,50 @@ import warnings
 warnings.filterwarnings("ignore")
 import logging
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
+logging.getLogger('waitress.queue').setLevel(logging.ERROR)
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, g, make_response, has_request_context, stream_with_context
 import sqlite3
 import json
+import html
+import re
+import gzip
+import base64
+import csv
+import argparse
+from contextlib import contextmanager
+from concurrent.futures import Future
+from collections import OrderedDict, deque
+from urllib.parse import urlencode
+import functools
+import itertools
+import bisect
+import random
+import cProfile
+import pstats
+import hashlib
+import queue
 from datetime import datetime
 import os
 import threading
-import webview
+import importlib.util
+from werkzeug.serving import make_server
+
+# Optional: brotli variants of the page assets (pip install brotli)
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Load Telegram config
 TELEGRAM_CONFIG_FILE = "telegram_config.json"
+# Inbox file written by older versions; migrated into telegram_inbox on startup
 PENDING_TASKS_FILE = "pending_telegram_tasks.json"
 bot = None
 bot_thread = None
 TELEGRAM_TOKEN = None
 TELEGRAM_ENABLED = False
+TELEGRAM_API_URL = None
 
 try:
     if os.path.exists(TELEGRAM_CONFIG_FILE):
@@ -43,21 +75,31 @@ try:
             config = json.load(f)
             TELEGRAM_TOKEN = config.get('bot_token', 'YOUR_BOT_TOKEN_HERE')
             TELEGRAM_ENABLED = config.get('enabled', False)
+            # Bot API server, e.g. a local stand-in for load testing (default: api.telegram.org)
+            TELEGRAM_API_URL = config.get('api_url')
 except:
     TELEGRAM_TOKEN = "YOUR_BOT_TOKEN_HERE"
     TELEGRAM_ENABLED = False
 
-# Import telebot only if enabled
-if TELEGRAM_ENABLED and TELEGRAM_TOKEN != "YOUR_BOT_TOKEN_HERE":
-    try:
-        import telebot
-        from telebot import types
-        telebot_available = True
-    except ImportError:
-        safe_print("⚠️ telebot not installed. Install it with: pip install pyTelegramBotAPI")
-        telebot_available = False
-else:
-    telebot_available = False
+# telebot is slow to import, so it is only loaded when the bot actually starts
+telebot = None
+
+def load_telebot():
+    """Import telebot on first use; None if it isn't installed"""
+    global telebot
+    if telebot is None:
+        try:
+            import telebot as telebot_module
+        except ImportError:
+            return None
+        if TELEGRAM_API_URL:
+            telebot_module.apihelper.API_URL = TELEGRAM_API_URL.rstrip('/') + '/bot{0}/{1}'
+            telebot_module.apihelper.FILE_URL = TELEGRAM_API_URL.rstrip('/') + '/file/bot{0}/{1}'
+        telebot = telebot_module
+    return telebot
+
+def telebot_installed():
+    return importlib.util.find_spec('telebot') is not None
 
 app = Flask(__name__)
 
@@ -68,6 +110,9 @@ class ExitAPI:
     def exit(self):
         """Exit the application"""
         import os
+        # Don't lose Telegram tasks still waiting to be written, or the window state
+        telegram_ingestor.stop()
+        window_settings.flush()
         # Force exit immediately
         os._exit(0)
         return True
@@ -75,11 +120,811 @@ class ExitAPI:
 # Create global instance
 exit_api = ExitAPI()
 
+# ============= METRICS =============
+
+# Request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Statements slower than this (execute + fetch) are logged with their query plan
+SLOW_QUERY_MS = float(os.environ.get('TASKMASTER_SLOW_QUERY_MS', '100'))
+# Longest SQL text kept in the query label; longer ones are shortened around a hash of the full text
+QUERY_LABEL_LENGTH = 240
+
+# "?, ?, ?" lists vary in length with the request; collapse them so they share a label
+PLACEHOLDER_LIST_RE = re.compile(r'\?(?:\s*,\s*\?)+')
+SELECT_RE = re.compile(r'\bSELECT (?:DISTINCT )?', re.IGNORECASE)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + '}'
+
+class Metrics:
+    """Request and SQL statistics for /api/metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}      # (route, method, status) -> count
+        self.latency = {}       # (route, method) -> Histogram
+        self.request_sql = {}   # (route, method) -> [statements, seconds]
+        self.queries = {}       # normalized SQL -> [calls, seconds, slow calls]
+
+    def observe_request(self, route, method, status, seconds, statements, sql_seconds):
+        with self._lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            key = (route, method)
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+
+            totals = self.request_sql.setdefault(key, [0, 0.0])
+            totals[0] += statements
+            totals[1] += sql_seconds
+
+    def observe_query(self, query, seconds, calls=1, slow=0):
+        with self._lock:
+            totals = self.queries.get(query)
+            if totals is None:
+                totals = self.queries[query] = [0, 0.0, 0]
+            totals[0] += calls
+            totals[1] += seconds
+            totals[2] += slow
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                '# HELP taskmaster_http_requests_total Requests handled, by route, method and status',
+                '# TYPE taskmaster_http_requests_total counter'
+            ]
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'taskmaster_http_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+            lines += [
+                '# HELP taskmaster_http_request_duration_seconds Time to produce a response',
+                '# TYPE taskmaster_http_request_duration_seconds histogram'
+            ]
+            for (route, method), histogram in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'taskmaster_http_request_duration_seconds_bucket{_labels(route=route, method=method, le=bound)} {cumulative}')
+                lines.append(f'taskmaster_http_request_duration_seconds_sum{_labels(route=route, method=method)} {histogram.sum:.6f}')
+                lines.append(f'taskmaster_http_request_duration_seconds_count{_labels(route=route, method=method)} {histogram.count}')
+
+            lines += [
+                '# HELP taskmaster_http_request_sql_statements_total SQL statements run while handling requests',
+                '# TYPE taskmaster_http_request_sql_statements_total counter'
+            ]
+            for (route, method), (statements, _) in sorted(self.request_sql.items()):
+                lines.append(f'taskmaster_http_request_sql_statements_total{_labels(route=route, method=method)} {statements}')
+            lines += [
+                '# HELP taskmaster_http_request_sql_seconds_total Time spent in SQL while handling requests',
+                '# TYPE taskmaster_http_request_sql_seconds_total counter'
+            ]
+            for (route, method), (_, seconds) in sorted(self.request_sql.items()):
+                lines.append(f'taskmaster_http_request_sql_seconds_total{_labels(route=route, method=method)} {seconds:.6f}')
+
+            for metric, index, help_text, fmt in (
+                ('taskmaster_sql_calls_total', 0, 'Times each statement ran', '{}'),
+                ('taskmaster_sql_seconds_total', 1, 'Time spent executing and fetching each statement', '{:.6f}'),
+                ('taskmaster_sql_slow_total', 2, f'Runs of each statement slower than {SLOW_QUERY_MS:g} ms', '{}')
+            ):
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+                for query, totals in sorted(self.queries.items()):
+                    lines.append(f'{metric}{_labels(query=query)} {fmt.format(totals[index])}')
+
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+# SQL statements and time for the request running on this thread
+_request_sql = threading.local()
+
+def _collapse_select_lists(sql):
+    """Replace multi-column select lists with '...'.
+
+    Which columns a list query fetches depends on the client's ?fields=,
+    so the label identifies a query by what it reads (FROM, WHERE, ORDER BY).
+    """
+    upper = sql.upper()
+    parts = []
+    position = 0
+    while (match := SELECT_RE.search(sql, position)) is not None:
+        start = index = match.end()
+        depth = 0
+        commas = 0
+        end = None
+        while index < len(sql):
+            char = sql[index]
+            if char == "'":
+                index = sql.find("'", index + 1)
+                if index == -1:
+                    break
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                if depth == 0:
+                    break
+                depth -= 1
+            elif depth == 0:
+                if char == ',':
+                    commas += 1
+                elif upper.startswith(' FROM ', index):
+                    end = index
+                    break
+            index += 1
+
+        if end is not None and commas:
+            parts.append(sql[position:start] + '...')
+            position = end
+        else:
+            parts.append(sql[position:start])
+            position = start
+    parts.append(sql[position:])
+    return ''.join(parts)
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """One-line SQL text used as the query label"""
+    label = _collapse_select_lists(PLACEHOLDER_LIST_RE.sub('?, ...', ' '.join(sql.split())))
+    if len(label) > QUERY_LABEL_LENGTH:
+        # Keep both ends readable; queries sharing them still get labels of their own
+        digest = hashlib.sha1(label.encode('utf-8')).hexdigest()[:8]
+        keep = (QUERY_LABEL_LENGTH - 14) // 2
+        label = f'{label[:keep]} ... {label[-keep:]} #{digest}'
+    return label
+
+def log_slow_query(conn, sql, parameters, seconds):
+    """Print a slow statement together with its query plan"""
+    plan = ''
+    if parameters is not None and sql.lstrip()[:6].upper() in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+        try:
+            # A plain cursor, so explaining doesn't count as another query
+            steps = conn.cursor(sqlite3.Cursor).execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+            plan = ''.join(f'\n    {step[3]}' for step in steps)
+        except sqlite3.Error as e:
+            plan = f'\n    (no plan: {e})'
+    safe_print(f"🐢 Slow query ({seconds * 1000:.1f} ms): {normalize_sql(sql)}{plan}")
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times execute and fetch calls and reports them to metrics"""
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(time.perf_counter() - started, calls=1)
+
+    def executemany(self, sql, seq_of_parameters):
+        # No single parameter set to explain with
+        self._start(sql, None)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(time.perf_counter() - started, calls=1)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._record(time.perf_counter() - started)
+
+    def _start(self, sql, parameters):
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = 0.0
+        self._slow_reported = False
+
+    def _record(self, seconds, calls=0):
+        if self._sql is None:
+            return
+        self._elapsed += seconds
+        slow = not self._slow_reported and self._elapsed * 1000 >= SLOW_QUERY_MS
+        metrics.observe_query(normalize_sql(self._sql), seconds, calls, int(slow))
+
+        _request_sql.statements = getattr(_request_sql, 'statements', 0) + calls
+        _request_sql.seconds = getattr(_request_sql, 'seconds', 0.0) + seconds
+
+        if slow:
+            self._slow_reported = True
+            log_slow_query(self.connection, self._sql, self._parameters, self._elapsed)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including the execute shortcuts) are instrumented"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    _request_sql.statements = 0
+    _request_sql.seconds = 0.0
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe_request(
+            route, request.method, response.status_code, time.perf_counter() - started,
+            getattr(_request_sql, 'statements', 0), getattr(_request_sql, 'seconds', 0.0)
+        )
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request and SQL statistics in Prometheus text format"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# ============= PROFILING =============
+
+# Off unless TASKMASTER_PROFILE=1; then requests carrying "X-Profile: 1", plus a
+# random TASKMASTER_PROFILE_SAMPLE_RATE fraction of all requests, are profiled
+PROFILE_ENABLED = os.environ.get('TASKMASTER_PROFILE') == '1'
+PROFILE_SAMPLE_RATE = float(os.environ.get('TASKMASTER_PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('TASKMASTER_PROFILE_DIR', 'profiles')
+# Only the newest captures are kept
+PROFILE_KEEP = 50
+PROFILE_HEADER = 'X-Profile'
+
+class RequestProfiler:
+    """cProfile captures written as .pstats files into a bounded directory.
+
+    File names are "<timestamp>_<method>_<label>_<microseconds>.pstats" so the
+    directory can be listed without opening anything. Only one capture runs
+    at a time; a request that wants one while another is running is just
+    served normally. Writes the profiled code hands to db_writer are
+    profiled on the writer thread and merged into the same capture.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+        self._busy = threading.Lock()
+        # Profiles from other threads that belong to this thread's capture
+        self._local = threading.local()
+
+    def wanted(self):
+        """Should the current request be profiled?"""
+        if not PROFILE_ENABLED:
+            return False
+        return request.headers.get(PROFILE_HEADER) == '1' or random.random() < PROFILE_SAMPLE_RATE
+
+    def start(self):
+        """A running profiler, or None if another capture is in progress"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        self._local.merged = []
+        return profiler
+
+    def active(self):
+        """Is the current thread being profiled?"""
+        return getattr(self._local, 'merged', None) is not None
+
+    def merge(self, profile):
+        """Add a profile taken on another thread to the current thread's capture"""
+        if self.active():
+            self._local.merged.append(profile)
+
+    def finish(self, profiler, method, label, seconds):
+        """Stop the profiler and save it; returns the file name"""
+        profiler.disable()
+        merged, self._local.merged = self._local.merged, None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            slug = re.sub(r'[^A-Za-z0-9]+', '-', label).strip('-') or 'root'
+            name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{method}_{slug}_{int(seconds * 1e6)}.pstats"
+            stats = pstats.Stats(profiler)
+            for profile in merged:
+                stats.add(profile)
+            stats.dump_stats(os.path.join(self.directory, name))
+            self._trim()
+            return name
+        finally:
+            self._busy.release()
+
+    @contextmanager
+    def capture(self, label):
+        """Profile a block outside of a request (when profiling is enabled)"""
+        profiler = self.start() if PROFILE_ENABLED else None
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                self.finish(profiler, 'TASK', label, time.perf_counter() - started)
+
+    def _trim(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith('.pstats'))
+        for name in names[:-self.keep]:
+            os.remove(os.path.join(self.directory, name))
+
+    def captures(self):
+        """Saved captures, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            parts = name[:-len('.pstats')].split('_')
+            if not name.endswith('.pstats') or len(parts) != 4:
+                continue
+            stamp, method, label, micros = parts
+            result.append({
+                'name': name,
+                'captured_at': datetime.strptime(stamp, '%Y%m%d-%H%M%S-%f').isoformat(),
+                'method': method,
+                'label': label,
+                'duration_ms': int(micros) / 1000,
+                'size': os.path.getsize(os.path.join(self.directory, name))
+            })
+        return result
+
+request_profiler = RequestProfiler()
+
+@app.before_request
+def start_request_profile():
+    if request_profiler.wanted():
+        g.profiler = request_profiler.start()
+        g.profile_started = time.perf_counter()
+
+@app.after_request
+def finish_request_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        label = request.url_rule.rule if request.url_rule is not None else request.path
+        name = request_profiler.finish(profiler, request.method, label, time.perf_counter() - g.profile_started)
+        response.headers['X-Profile-File'] = name
+    return response
+
+@app.teardown_request
+def abandon_request_profile(exception):
+    # after_request didn't run (the request failed), but the profiler must still be released
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        request_profiler.finish(profiler, request.method, 'failed', time.perf_counter() - g.profile_started)
+
+@app.route('/api/debug/profiles', methods=['GET'])
+def list_profiles():
+    """Recent profile captures"""
+    if not PROFILE_ENABLED:
+        return jsonify({'error': 'Profiling is disabled (set TASKMASTER_PROFILE=1)'}), 404
+    return jsonify(request_profiler.captures())
+
+@app.route('/api/debug/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    """One capture as a .pstats file (open with pstats, snakeviz, flameprof, ...)"""
+    if not PROFILE_ENABLED:
+        return jsonify({'error': 'Profiling is disabled (set TASKMASTER_PROFILE=1)'}), 404
+    if name not in {capture['name'] for capture in request_profiler.captures()}:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(os.path.abspath(os.path.join(request_profiler.directory, name)),
+                     mimetype='application/octet-stream', as_attachment=True)
+
+# ============= DATABASE CONNECTIONS =============
+
+# Database location (use ":memory:" for a throwaway in-memory database)
+DATABASE_PATH = os.environ.get('TASKMASTER_DB', 'todos.db')
+DB_POOL_SIZE = 8
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KB = 16384
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_STATEMENT_CACHE_SIZE = 256
+
+class ConnectionPool:
+    """Keeps tuned SQLite connections around so requests don't pay for connect + setup"""
+
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._anchor = None
+
+        if path == ':memory:':
+            # Every connection must see the same in-memory database, so use a
+            # named memdb URI and keep one connection open to hold it alive
+            self._target = f'file:/taskmaster-{id(self)}?vfs=memdb'
+            self._uri = True
+            self._anchor = self._connect()
+        else:
+            self._target = path
+            self._uri = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self._target,
+            uri=self._uri,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            factory=InstrumentedConnection
+        )
+        # Only takes effect on a brand-new file, and only before switching to WAL
+        # writes its header; older databases are converted by MaintenanceScheduler
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def acquire(self):
+        """Get a connection for the current thread (nested calls share it)"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self, conn):
+        """Give a connection back once the current thread is done with it"""
+        if getattr(self._local, 'conn', None) is not conn:
+            return
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        self._local.conn = None
+
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def dedicated(self):
+        """A tuned connection outside the pool, for long-lived single-purpose use"""
+        return self._connect()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+db_pool = ConnectionPool(DATABASE_PATH)
+
+def get_db():
+    """Return the pooled connection for the current request"""
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+# Write batching: one transaction takes up to this many commands, arriving within this window
+WRITE_BATCH_SIZE = 256
+WRITE_BATCH_WINDOW_SECONDS = 0.001
+# How long a caller waits for its command to commit
+WRITE_TIMEOUT_SECONDS = 30
+
+class DatabaseWriter:
+    """The one thread that writes to the database.
+
+    Callers hand it commands, functions taking a cursor, and get a Future
+    for the return value. The writer runs whatever has queued up (within
+    WRITE_BATCH_WINDOW_SECONDS) in one transaction, each command inside its
+    own savepoint so a failing command is rolled back alone, then commits
+    once and resolves the futures. Commands must not commit themselves.
+
+    The SQL a command runs counts toward the request that called run(),
+    with the batch's BEGIN and COMMIT time shared out evenly. Commands
+    submitted by a thread that is being profiled are profiled on the
+    writer thread and merged into that capture.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, command, *args):
+        """Queue command(cursor, *args); returns a Future for its result"""
+        return self._submit(command, args, False)
+
+    def _submit(self, command, args, exclusive):
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # A command that writes more joins the transaction it is already in
+            try:
+                future.set_result(command(self._cursor, *args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self.start()
+        self._queue.put((command, args, future, request_profiler.active(), exclusive))
+        return future
+
+    def run(self, command, *args):
+        """submit() and wait for the commit; raises whatever the command raised"""
+        return self._wait(self.submit(command, *args), WRITE_TIMEOUT_SECONDS)
+
+    def run_exclusive(self, command, *args):
+        """run() for a command SQLite refuses inside a transaction (VACUUM).
+
+        It runs on its own, between batches, and may take as long as it needs.
+        """
+        return self._wait(self._submit(command, args, True), None)
+
+    def _wait(self, future, timeout):
+        try:
+            return future.result(timeout)
+        finally:
+            # Set by the writer thread (commands run inline were counted where they ran)
+            statements, seconds = getattr(future, 'sql', (0, 0.0))
+            _request_sql.statements = getattr(_request_sql, 'statements', 0) + statements
+            _request_sql.seconds = getattr(_request_sql, 'seconds', 0.0) + seconds
+            if getattr(future, 'profile', None) is not None:
+                request_profiler.merge(future.profile)
+
+    @staticmethod
+    def _take_sql():
+        """Statements and seconds counted on this thread since the last call"""
+        taken = (getattr(_request_sql, 'statements', 0), getattr(_request_sql, 'seconds', 0.0))
+        _request_sql.statements = 0
+        _request_sql.seconds = 0.0
+        return taken
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + WRITE_BATCH_WINDOW_SECONDS
+        while len(batch) < WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self.pool.dedicated()
+        conn.isolation_level = None
+        self._cursor = conn.cursor()
+        while True:
+            for exclusive, commands in itertools.groupby(self._next_batch(), key=lambda item: item[4]):
+                if exclusive:
+                    for item in commands:
+                        self._write_alone(*item)
+                else:
+                    self._write(conn, list(commands))
+
+    def _write_alone(self, command, args, future, profiled, exclusive):
+        if not future.set_running_or_notify_cancel():
+            return
+        self._take_sql()
+        try:
+            value = self._profile(future, command, args) if profiled else command(self._cursor, *args)
+        except Exception as e:
+            future.sql = self._take_sql()
+            future.set_exception(e)
+        else:
+            future.sql = self._take_sql()
+            future.set_result(value)
+
+    def _write(self, conn, batch):
+        results = []
+        self._take_sql()
+        try:
+            self._cursor.execute('BEGIN IMMEDIATE')
+            shared_seconds = self._take_sql()[1]
+            for command, args, future, profiled, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._cursor.execute('SAVEPOINT command')
+                try:
+                    if profiled:
+                        results.append((future, True, self._profile(future, command, args)))
+                    else:
+                        results.append((future, True, command(self._cursor, *args)))
+                    self._cursor.execute('RELEASE command')
+                except Exception as e:
+                    self._cursor.execute('ROLLBACK TO command')
+                    self._cursor.execute('RELEASE command')
+                    results.append((future, False, e))
+                future.sql = self._take_sql()
+            self._cursor.execute('COMMIT')
+            shared_seconds += self._take_sql()[1]
+        except Exception as e:
+            # The whole batch is lost (e.g. the disk is full): fail every waiting command
+            if conn.in_transaction:
+                self._cursor.execute('ROLLBACK')
+            for command, args, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, succeeded, value in results:
+            statements, seconds = future.sql
+            future.sql = (statements, seconds + shared_seconds / len(results))
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _profile(self, future, command, args):
+        """Run a command under its own profiler, kept on the future for run() to merge"""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this process and already sees this thread
+            return command(self._cursor, *args)
+        try:
+            return command(self._cursor, *args)
+        finally:
+            profile.disable()
+            future.profile = profile
+
+db_writer = DatabaseWriter(db_pool)
+
+# Served while migrations are still running
+DB_FREE_ENDPOINTS = {
+    'index', 'serve_asset', 'favicon', 'serve_font', 'static',
+    'get_metrics', 'list_profiles', 'download_profile', 'maintenance_reports'
+}
+
+@app.before_request
+def wait_for_db():
+    if request.endpoint not in DB_FREE_ENDPOINTS:
+        ensure_db()
+
+# Full-text search (switched off by init_db if SQLite lacks FTS5)
+FTS_ENABLED = True
+
 # Database initialization
 def init_db():
-    conn = sqlite3.connect('todos.db')
+    global FTS_ENABLED
+
+    with db_pool.connection() as conn:
+        previous_version = run_migrations(conn)
+
+        cursor = conn.cursor()
+
+        # Insert default folder if none exists
+        cursor.execute('SELECT COUNT(*) FROM folders')
+        if cursor.fetchone()[0] == 0:
+            cursor.execute('INSERT INTO folders (name, color) VALUES (?, ?)', ('General', '#667eea'))
+            conn.commit()
+
+        try:
+            cursor.execute('SELECT rowid FROM todos_fts LIMIT 0')
+            FTS_ENABLED = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: searches fall back to LIKE
+            FTS_ENABLED = False
+
+        # _create_telegram_inbox imported the file if it ran just now; one that
+        # turned up later (an older build run again, a copy from elsewhere) is imported here
+        if previous_version > MIGRATIONS.index(_create_telegram_inbox):
+            import_pending_tasks_file(conn)
+
+    # Its contents now live in telegram_inbox
+    if os.path.exists(PENDING_TASKS_FILE):
+        os.remove(PENDING_TASKS_FILE)
+
+# Set once init_db has run; requests that touch the database wait for it
+db_ready = threading.Event()
+_db_init_lock = threading.Lock()
+
+def ensure_db():
+    """Run init_db once, or wait for the thread that is already running it"""
+    if db_ready.is_set():
+        return
+    with _db_init_lock:
+        if not db_ready.is_set():
+            init_db()
+            db_ready.set()
+
+def run_migrations(conn):
+    """Bring the schema up to date, one numbered migration per transaction.
+
+    The schema version lives in PRAGMA user_version; MIGRATIONS[n] moves a
+    database from version n to n + 1. Append new migrations, never edit old ones.
+    Returns the version the database was at before.
+    """
     cursor = conn.cursor()
-    
+    cursor.execute('PRAGMA user_version')
+    version = cursor.fetchone()[0]
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        if migration in NON_TRANSACTIONAL_MIGRATIONS:
+            # These must be safe to repeat: a crash before the version bump runs them again
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {number}')
+            continue
+
+        cursor.execute('BEGIN')
+        try:
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return version
+
+def _create_base_schema(cursor):
     # Create folders table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS folders (
@@ -120,12 +965,7 @@ def init_db():
         )
     ''')
 
-    # Insert default folder if none exists
-    cursor.execute('SELECT COUNT(*) FROM folders')
-    if cursor.fetchone()[0] == 0:
-        cursor.execute('INSERT INTO folders (name, color) VALUES (?, ?)', ('General', '#667eea'))
-
-    # Migration: Add new columns to existing databases
+    # Add columns missing from databases created by older versions
     cursor.execute("PRAGMA table_info(todos)")
     existing_columns = [column[1] for column in cursor.fetchall()]
 
@@ -137,85 +977,849 @@ def init_db():
         cursor.execute('ALTER TABLE todos ADD COLUMN today_date TIMESTAMP DEFAULT NULL')
     if 'archived' not in existing_columns:
         cursor.execute('ALTER TABLE todos ADD COLUMN archived BOOLEAN DEFAULT FALSE')
-    
-    conn.commit()
-    conn.close()
 
-# Initialize database on startup
-init_db()
+def _create_search_index(cursor):
+    """Create the FTS5 tables for todos/notes and the triggers that keep them in sync"""
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(
+                title, description,
+                content='todos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                content,
+                content='notes', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        safe_print(f"⚠️ Full-text search unavailable: {e}")
+        return
 
-# ============= TELEGRAM BOT FUNCTIONS =============
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS todos_fts_insert AFTER INSERT ON todos BEGIN
+            INSERT INTO todos_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS todos_fts_delete AFTER DELETE ON todos BEGIN
+            INSERT INTO todos_fts (todos_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS todos_fts_update AFTER UPDATE OF title, description ON todos BEGIN
+            INSERT INTO todos_fts (todos_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO todos_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, content) VALUES (new.id, new.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF content ON notes BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO notes_fts (rowid, content) VALUES (new.id, new.content);
+        END
+    ''')
 
-def load_pending_tasks():
-    """Load pending tasks from Telegram messages"""
-    if not os.path.exists(PENDING_TASKS_FILE):
-        return []
+    # Index rows that existed before the search tables did
+    cursor.execute("INSERT INTO todos_fts (todos_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
 
-    try:
-        with open(PENDING_TASKS_FILE, 'r', encoding='utf-8') as f:
-            tasks = json.load(f)
+def _create_folder_counters(cursor):
+    """Per-folder todo/completed totals, kept exact by triggers on todos"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS folder_counters (
+            folder_id INTEGER PRIMARY KEY,
+            todo_count INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS folder_counters_insert AFTER INSERT ON todos
+        WHEN new.folder_id IS NOT NULL BEGIN
+            INSERT OR IGNORE INTO folder_counters (folder_id) VALUES (new.folder_id);
+            UPDATE folder_counters
+            SET todo_count = todo_count + 1, completed_count = completed_count + (new.completed = 1)
+            WHERE folder_id = new.folder_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS folder_counters_delete AFTER DELETE ON todos
+        WHEN old.folder_id IS NOT NULL BEGIN
+            UPDATE folder_counters
+            SET todo_count = todo_count - 1, completed_count = completed_count - (old.completed = 1)
+            WHERE folder_id = old.folder_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS folder_counters_update AFTER UPDATE OF folder_id, completed ON todos BEGIN
+            UPDATE folder_counters
+            SET todo_count = todo_count - 1, completed_count = completed_count - (old.completed = 1)
+            WHERE folder_id = old.folder_id;
+            INSERT OR IGNORE INTO folder_counters (folder_id)
+            SELECT new.folder_id WHERE new.folder_id IS NOT NULL;
+            UPDATE folder_counters
+            SET todo_count = todo_count + 1, completed_count = completed_count + (new.completed = 1)
+            WHERE folder_id = new.folder_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS folder_counters_folder_delete AFTER DELETE ON folders BEGIN
+            DELETE FROM folder_counters WHERE folder_id = old.id;
+        END
+    ''')
 
-        # Clear the file after loading
-        with open(PENDING_TASKS_FILE, 'w') as f:
-            json.dump([], f)
+    # Count the todos that existed before the counters did
+    cursor.execute('DELETE FROM folder_counters')
+    cursor.execute('''
+        INSERT INTO folder_counters (folder_id, todo_count, completed_count)
+        SELECT folder_id, COUNT(*), SUM(completed = 1)
+        FROM todos
+        WHERE folder_id IS NOT NULL
+        GROUP BY folder_id
+    ''')
 
-        return tasks
-    except:
-        return []
+def _stat_change(dimension, key_sql, delta_sql):
+    """SQL that adds delta_sql to one todo_stats counter (trigger body helper)"""
+    return f'''
+            INSERT OR IGNORE INTO todo_stats (dimension, key) VALUES ('{dimension}', {key_sql});
+            UPDATE todo_stats SET count = count + ({delta_sql})
+            WHERE dimension = '{dimension}' AND key = {key_sql};'''
+
+def _stat_changes(row, sign, include_total=True):
+    """Trigger body that counts row ('new' or 'old') in or out of every stats bucket"""
+    changes = []
+    if include_total:
+        changes.append(_stat_change('status', "'total'", sign))
+    changes.append(_stat_change('status', "'completed'", f'{sign} * ({row}.completed = 1)'))
+    changes.append(_stat_change('status', "'pending'", f'{sign} * ({row}.completed = 0)'))
+    changes.append(_stat_change('priority', f"COALESCE({row}.priority, '')", sign))
+    changes.append(_stat_change('category', f"COALESCE({row}.category, '')", sign))
+    return ''.join(changes)
+
+def _create_todo_stats(cursor):
+    """Summary counters behind /api/stats, kept up to date by triggers on todos"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS todo_stats (
+            dimension TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, key)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS todo_stats_insert AFTER INSERT ON todos BEGIN
+            {_stat_changes('new', '1')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS todo_stats_delete AFTER DELETE ON todos BEGIN
+            {_stat_changes('old', '-1')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS todo_stats_update AFTER UPDATE OF completed, priority, category ON todos BEGIN
+            {_stat_changes('old', '-1', include_total=False)}
+            {_stat_changes('new', '1', include_total=False)}
+        END
+    ''')
 
-def save_telegram_task(user_id, username, message):
-    """Save a Telegram message as a pending task"""
-    tasks = []
+    # Count the todos that existed before the stats table did
+    cursor.execute('DELETE FROM todo_stats')
+    cursor.execute('''
+        INSERT INTO todo_stats (dimension, key, count)
+        SELECT 'status', 'total', COUNT(*) FROM todos
+        UNION ALL
+        SELECT 'status', 'completed', COUNT(*) FROM todos WHERE completed = 1
+        UNION ALL
+        SELECT 'status', 'pending', COUNT(*) FROM todos WHERE completed = 0
+        UNION ALL
+        SELECT 'priority', COALESCE(priority, ''), COUNT(*) FROM todos GROUP BY 2
+        UNION ALL
+        SELECT 'category', COALESCE(category, ''), COUNT(*) FROM todos GROUP BY 2
+    ''')
+
+def _create_indexes(cursor):
+    """Indexes matching the filters and orderings of the todo list queries"""
+    # Main list: archived filter, newest first, optionally narrowed by status/folder/category
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_archived_created ON todos (archived, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_archived_completed_created ON todos (archived, completed, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_folder_archived_created ON todos (folder_id, archived, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_category_archived_created ON todos (category, archived, created_at)')
+    # include_archived=true lists everything, newest first
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_created ON todos (created_at)')
+    # Today view
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_todos_today
+        ON todos (added_to_today, archived, COALESCE(today_date, ''), created_at)
+    ''')
+    # Archive view: most recently archived first
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_archived_updated ON todos (archived, updated_at)')
+
+def _create_telegram_inbox(cursor):
+    """Append-only queue of Telegram messages, with per-user pending counts kept by triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS telegram_inbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            message TEXT NOT NULL,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS telegram_inbox_counts (
+            user_id INTEGER PRIMARY KEY,
+            pending INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS telegram_inbox_insert AFTER INSERT ON telegram_inbox BEGIN
+            INSERT OR IGNORE INTO telegram_inbox_counts (user_id) VALUES (new.user_id);
+            UPDATE telegram_inbox_counts SET pending = pending + 1 WHERE user_id = new.user_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS telegram_inbox_delete AFTER DELETE ON telegram_inbox BEGIN
+            UPDATE telegram_inbox_counts SET pending = pending - 1 WHERE user_id = old.user_id;
+        END
+    ''')
 
+    # Carry over messages queued by older versions in pending_telegram_tasks.json.
+    # This commits together with the version bump; init_db removes the file afterwards.
     if os.path.exists(PENDING_TASKS_FILE):
         try:
             with open(PENDING_TASKS_FILE, 'r', encoding='utf-8') as f:
                 tasks = json.load(f)
-        except:
+        except (OSError, ValueError) as e:
+            # Keep the unreadable file around for manual recovery
+            safe_print(f"⚠️ Could not read {PENDING_TASKS_FILE}: {e}")
+            os.replace(PENDING_TASKS_FILE, PENDING_TASKS_FILE + '.bad')
             tasks = []
 
-    task = {
-        'user_id': user_id,
-        'username': username,
-        'message': message,
-        'timestamp': datetime.now().isoformat()
-    }
+        cursor.executemany('''
+            INSERT INTO telegram_inbox (user_id, username, message, received_at)
+            VALUES (?, ?, ?, ?)
+        ''', [
+            (task['user_id'], task.get('username'), task['message'], task.get('timestamp'))
+            for task in tasks
+            if task.get('message')
+        ])
+
+# Every todo column, in one fixed order for copying rows between todos and todos_archive
+TODO_COLUMNS = ('id, title, description, completed, priority, category, folder_id, '
+                'kanban_status, added_to_today, today_date, archived, created_at, updated_at')
+
+def _create_todos_archive(cursor):
+    """Cold store for archived todos, so the active table and its indexes stay small.
+
+    Rows keep their id when they move (see move_archived_todos), and the
+    counter/stats/search triggers mirror the ones on todos, so a move
+    leaves folder_counters and todo_stats unchanged.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS todos_archive (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            completed BOOLEAN DEFAULT FALSE,
+            priority TEXT DEFAULT 'medium',
+            category TEXT DEFAULT 'general',
+            folder_id INTEGER DEFAULT NULL,
+            kanban_status TEXT DEFAULT 'todo',
+            added_to_today BOOLEAN DEFAULT FALSE,
+            today_date TIMESTAMP DEFAULT NULL,
+            archived BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (folder_id) REFERENCES folders (id) ON DELETE SET NULL
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE VIEW IF NOT EXISTS all_todos AS
+        SELECT {TODO_COLUMNS} FROM todos
+        UNION ALL
+        SELECT {TODO_COLUMNS} FROM todos_archive
+    ''')
+
+    # Archive view: most recently archived first
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_archive_updated ON todos_archive (updated_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_archive_created ON todos_archive (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_archive_folder ON todos_archive (folder_id)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_todos_archive_today
+        ON todos_archive (added_to_today, COALESCE(today_date, ''), created_at)
+    ''')
+    # Rows waiting to move back: normally none, so the check is one index probe
+    # (todos already has (archived, ...) indexes for the other direction)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_todos_archive_unarchived ON todos_archive (id) WHERE archived = 0')
+    # The archived column no longer varies within todos
+    cursor.execute('DROP INDEX IF EXISTS idx_todos_archived_updated')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS todos_archive_counters_insert AFTER INSERT ON todos_archive
+        WHEN new.folder_id IS NOT NULL BEGIN
+            INSERT OR IGNORE INTO folder_counters (folder_id) VALUES (new.folder_id);
+            UPDATE folder_counters
+            SET todo_count = todo_count + 1, completed_count = completed_count + (new.completed = 1)
+            WHERE folder_id = new.folder_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS todos_archive_counters_delete AFTER DELETE ON todos_archive
+        WHEN old.folder_id IS NOT NULL BEGIN
+            UPDATE folder_counters
+            SET todo_count = todo_count - 1, completed_count = completed_count - (old.completed = 1)
+            WHERE folder_id = old.folder_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS todos_archive_counters_update AFTER UPDATE OF folder_id, completed ON todos_archive BEGIN
+            UPDATE folder_counters
+            SET todo_count = todo_count - 1, completed_count = completed_count - (old.completed = 1)
+            WHERE folder_id = old.folder_id;
+            INSERT OR IGNORE INTO folder_counters (folder_id)
+            SELECT new.folder_id WHERE new.folder_id IS NOT NULL;
+            UPDATE folder_counters
+            SET todo_count = todo_count + 1, completed_count = completed_count + (new.completed = 1)
+            WHERE folder_id = new.folder_id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS todos_archive_stats_insert AFTER INSERT ON todos_archive BEGIN
+            {_stat_changes('new', '1')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS todos_archive_stats_delete AFTER DELETE ON todos_archive BEGIN
+            {_stat_changes('old', '-1')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS todos_archive_stats_update AFTER UPDATE OF completed, priority, category ON todos_archive BEGIN
+            {_stat_changes('old', '-1', include_total=False)}
+            {_stat_changes('new', '1', include_total=False)}
+        END
+    ''')
+
+    # Search: same shape as todos_fts, skipped when SQLite lacks FTS5
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS todos_archive_fts USING fts5(
+                title, description,
+                content='todos_archive', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        safe_print(f"⚠️ Full-text search unavailable: {e}")
+    else:
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS todos_archive_fts_insert AFTER INSERT ON todos_archive BEGIN
+                INSERT INTO todos_archive_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS todos_archive_fts_delete AFTER DELETE ON todos_archive BEGIN
+                INSERT INTO todos_archive_fts (todos_archive_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS todos_archive_fts_update AFTER UPDATE OF title, description ON todos_archive BEGIN
+                INSERT INTO todos_archive_fts (todos_archive_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+                INSERT INTO todos_archive_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+            END
+        ''')
+
+    # Move the tasks archived by older versions; the triggers on both tables keep the counts
+    cursor.execute(f'INSERT INTO todos_archive ({TODO_COLUMNS}) SELECT {TODO_COLUMNS} FROM todos WHERE archived = 1')
+    cursor.execute('DELETE FROM todos WHERE archived = 1')
+
+def _enable_incremental_vacuum(cursor):
+    """Used to switch to auto_vacuum=INCREMENTAL with a full VACUUM, holding up startup.
+
+    New databases now start in that mode (see ConnectionPool._connect) and older ones
+    are converted by MaintenanceScheduler once the app is idle, so this step
+    only keeps the version numbers in place.
+    """
+
+def _create_jobs(cursor):
+    """Background jobs (see JobRunner), and the flag that hides a folder while its job deletes it"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'queued',
+            total INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state)')
+
+    cursor.execute("PRAGMA table_info(folders)")
+    if 'deleting' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE folders ADD COLUMN deleting BOOLEAN DEFAULT FALSE')
+
+def _add_job_state(cursor):
+    """Per-job step state (position) and outcome (result), both JSON"""
+    cursor.execute('ALTER TABLE jobs ADD COLUMN position TEXT')
+    cursor.execute('ALTER TABLE jobs ADD COLUMN result TEXT')
+
+def _add_job_owner(cursor):
+    """Which process runs a job (owner) and when it last made progress (heartbeat, unix time)"""
+    cursor.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+    cursor.execute('ALTER TABLE jobs ADD COLUMN heartbeat REAL')
+
+def _add_job_cancel_request(cursor):
+    """Cancel requests live in the jobs table, so whichever process runs the job sees them"""
+    cursor.execute('ALTER TABLE jobs ADD COLUMN cancel_requested BOOLEAN DEFAULT FALSE')
+
+# Schema history: MIGRATIONS[n] upgrades a database from user_version n to n + 1
+MIGRATIONS = [
+    _create_base_schema,
+    _create_search_index,
+    _create_folder_counters,
+    _create_todo_stats,
+    _create_indexes,
+    _create_telegram_inbox,
+    _create_todos_archive,
+    _enable_incremental_vacuum,
+    _create_jobs,
+    _add_job_state,
+    _add_job_owner,
+    _add_job_cancel_request
+]
+
+# Migrations SQLite refuses to run inside a transaction (VACUUM)
+NON_TRANSACTIONAL_MIGRATIONS = set()
 
-    tasks.append(task)
+# ============= TELEGRAM BOT FUNCTIONS =============
+
+def save_telegram_task(user_id, username, message):
+    """Save a Telegram message as a pending task (a single append to telegram_inbox)"""
+    ensure_db()
+    db_writer.run(lambda cursor: cursor.execute('''
+        INSERT INTO telegram_inbox (user_id, username, message, received_at)
+        VALUES (?, ?, ?, ?)
+    ''', (user_id, username, message, datetime.now().isoformat())))
 
-    with open(PENDING_TASKS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(tasks, f, ensure_ascii=False, indent=2)
+def import_pending_tasks_file(conn):
+    """Move messages from an old build's pending_telegram_tasks.json into telegram_inbox.
+
+    The caller removes the file once this has committed.
+    """
+    if not os.path.exists(PENDING_TASKS_FILE):
+        return 0
+    try:
+        with open(PENDING_TASKS_FILE, 'r', encoding='utf-8') as f:
+            tasks = json.load(f)
+    except (OSError, ValueError) as e:
+        # Keep the unreadable file around for manual recovery
+        safe_print(f"⚠️ Could not read {PENDING_TASKS_FILE}: {e}")
+        os.replace(PENDING_TASKS_FILE, PENDING_TASKS_FILE + '.bad')
+        return 0
+
+    rows = [
+        (task['user_id'], task.get('username'), task['message'], task.get('timestamp'))
+        for task in tasks
+        if task.get('message')
+    ]
+    conn.executemany('''
+        INSERT INTO telegram_inbox (user_id, username, message, received_at)
+        VALUES (?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    if rows:
+        safe_print(f"📥 Moved {len(rows)} Telegram task(s) from {PENDING_TASKS_FILE} to the inbox")
+    return len(rows)
+
+def count_pending_tasks(user_id):
+    """Number of this user's messages still waiting in the inbox"""
+    ensure_db()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT pending FROM telegram_inbox_counts WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+# Description of a todo created from a Telegram message, followed by the sender's username
+TELEGRAM_DESCRIPTION_PREFIX = 'From Telegram bot via @'
+
+def telegram_description(username):
+    """Description for a Telegram task; inbox rows may have no username"""
+    return TELEGRAM_DESCRIPTION_PREFIX + (username or '')
+
+def telegram_folder_id(cursor):
+    """Folder Telegram tasks go to: General (id 1), or the oldest folder left if it is gone or being deleted"""
+    cursor.execute('SELECT id FROM folders WHERE deleting = 0 ORDER BY id != 1, id LIMIT 1')
+    row = cursor.fetchone()
+    return row[0] if row else None
 
 def import_telegram_tasks_to_db():
-    """Import pending Telegram tasks into the database"""
-    pending_tasks = load_pending_tasks()
-    imported_count = 0
+    """Move everything in the Telegram inbox into todos.
 
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    The todo inserts and the inbox delete share one transaction, so each
+    message is imported exactly once even if the app dies halfway through.
+    """
+    ensure_db()
+
+    # Runs on the writer, so a concurrent import waits instead of double-importing
+    def write(cursor):
+        cursor.execute('SELECT MAX(id) FROM telegram_inbox')
+        last_inbox_id = cursor.fetchone()[0]
+        if last_inbox_id is None:
+            return 0, None
+
+        folder_id = telegram_folder_id(cursor)
+        if folder_id is None:
+            # Nowhere to put them yet; they stay in the inbox
+            return 0, None
+
+        # Titles limited to 100 chars
+        cursor.execute('''
+            INSERT INTO todos (title, description, priority, category, folder_id, kanban_status)
+            SELECT substr(message, 1, 100), ? || COALESCE(username, ''),
+                   'medium', 'general', ?, 'todo'
+            FROM telegram_inbox
+            WHERE id <= ?
+            ORDER BY id
+        ''', (TELEGRAM_DESCRIPTION_PREFIX, folder_id, last_inbox_id))
+        imported_count = cursor.rowcount
+        last_todo_id = cursor.lastrowid
+
+        cursor.execute('DELETE FROM telegram_inbox WHERE id <= ?', (last_inbox_id,))
+        return imported_count, last_todo_id
+
+    imported_count, last_todo_id = db_writer.run(write)
+    if not imported_count:
+        return 0
+
+    # Rows from one INSERT ... SELECT get consecutive AUTOINCREMENT ids
+    imported_ids = list(range(last_todo_id - imported_count + 1, last_todo_id + 1))
+    with db_pool.connection() as conn:
+        notify_change('todo', 'created', load_todos(conn, imported_ids))
+
+    return imported_count
+
+# Ingestion batching: flush after this many messages or this long after the first one
+INGEST_BATCH_SIZE = 100
+INGEST_BATCH_WINDOW_SECONDS = 0.05
+
+class TelegramIngestor:
+    """Writes Telegram messages into todos from a background thread.
+
+    Bot handlers call submit() and return immediately. The writer thread
+    waits for the first message, gathers whatever else arrives within
+    INGEST_BATCH_WINDOW_SECONDS (up to INGEST_BATCH_SIZE messages) and
+    inserts the batch in one transaction. If that write fails the batch
+    goes to telegram_inbox instead, to be imported later. Senders are only
+    told a task was saved once it has been committed.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # chat id -> messages submitted but not yet committed
+        self._in_flight = {}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='telegram-ingest', daemon=True)
+                self._thread.start()
+
+    def submit(self, message, username):
+        """Queue a bot message; the confirmation is sent after it is committed"""
+        self.start()
+        with self._lock:
+            self._in_flight[message.chat.id] = self._in_flight.get(message.chat.id, 0) + 1
+        self._queue.put((message.chat.id, username, message.text, message))
+
+    def in_flight(self, user_id):
+        """How many of this chat's messages are still waiting to be written"""
+        with self._lock:
+            return self._in_flight.get(user_id, 0)
+
+    def stop(self, timeout=5):
+        """Flush queued messages and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _next_batch(self):
+        """Block for one message, then collect a batch; None in the queue means stop"""
+        first = self._queue.get()
+        if first is None:
+            return None, True
+
+        batch = [first]
+        deadline = time.monotonic() + INGEST_BATCH_WINDOW_SECONDS
+        while len(batch) < INGEST_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stopping = self._next_batch()
+            if batch:
+                # A failed batch must not end the thread, or every later message would sit in the queue
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    safe_print(f"⚠️ Telegram ingest failed: {e}")
+                finally:
+                    self._done(batch)
+            if stopping:
+                return
+
+    def _done(self, batch):
+        with self._lock:
+            for user_id, _, _, _ in batch:
+                left = self._in_flight.get(user_id, 0) - 1
+                if left > 0:
+                    self._in_flight[user_id] = left
+                else:
+                    self._in_flight.pop(user_id, None)
+
+    def _write(self, batch):
+        def write(cursor):
+            folder_id = telegram_folder_id(cursor)
+            if folder_id is None:
+                raise FolderDeleting(1)
+            created_ids = []
+            for user_id, username, message, _ in batch:
+                # Title limited to 100 chars
+                cursor.execute('''
+                    INSERT INTO todos (title, description, priority, category, folder_id, kanban_status)
+                    VALUES (?, ?, 'medium', 'general', ?, 'todo')
+                ''', (message[:100], telegram_description(username), folder_id))
+                created_ids.append(cursor.lastrowid)
+            return created_ids
 
-    for task in pending_tasks:
-        # Add task to General folder (folder_id = 1)
         try:
-            cursor.execute('''
-                INSERT INTO todos (title, description, priority, category, folder_id, kanban_status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                task['message'][:100],  # Title (limit to 100 chars)
-                f"From Telegram bot via @{task['username']}",  # Description
-                'medium',  # Default priority
-                'general',  # Default category
-                1,  # General folder
-                'todo'  # Default kanban status
-            ))
-            imported_count += 1
+            ensure_db()
+            created_ids = db_writer.run(write)
         except Exception as e:
-            print(f"Error importing task: {e}")
+            safe_print(f"⚠️ Telegram ingest failed, keeping {len(batch)} task(s) in the inbox: {e}")
+            for user_id, username, message, bot_message in batch:
+                try:
+                    save_telegram_task(user_id, username, message)
+                except Exception as e:
+                    # Nowhere left to keep it: the log is the only copy
+                    safe_print(f"⚠️ Lost Telegram task from @{username}: {message!r} ({e})")
+                    telegram_outbox.reply(bot_message, "⚠️ Sorry, I couldn't save that task. Please send it again.")
+                else:
+                    telegram_outbox.reply(bot_message, "📥 Task received! It will be added to TaskMaster the next time you open the app.")
+            return
+
+        for _, _, _, bot_message in batch:
+            telegram_outbox.confirm_saved(bot_message)
 
-    conn.commit()
-    conn.close()
+        try:
+            with db_pool.connection() as conn:
+                notify_change('todo', 'created', load_todos(conn, created_ids))
+        except Exception as e:
+            safe_print(f"⚠️ Could not publish Telegram tasks: {e}")
+
+telegram_ingestor = TelegramIngestor()
+
+# Bot update processing: handler threads, and how many updates each may have queued
+TELEGRAM_WORKERS = 4
+TELEGRAM_WORKER_QUEUE_SIZE = 200
+TELEGRAM_UPDATE_BATCH_SIZE = 100
+TELEGRAM_POLL_TIMEOUT = 50
+# Bot API limits: about 30 messages/second overall and 1 message/second per chat
+TELEGRAM_SEND_RATE = 25
+TELEGRAM_CHAT_REPLY_INTERVAL = 1.0
+# Coalesced "tasks saved" replies list at most this many titles
+TELEGRAM_SAVED_LIST_LIMIT = 10
+
+class TelegramOutbox:
+    """Sends bot replies from one thread, within Telegram's rate limits.
+
+    Replies are queued per chat and sent in order. A chat gets at most one
+    message per TELEGRAM_CHAT_REPLY_INTERVAL; task confirmations that pile
+    up in the meantime go out as a single "saved N tasks" message.
+    """
 
-    return imported_count
+    def __init__(self):
+        self._bot = None
+        self._pending = OrderedDict()   # chat id -> [(kind, message, text)]
+        self._next_send = {}            # chat id -> earliest time of its next message
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self, bot):
+        with self._cond:
+            self._bot = bot
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='telegram-outbox', daemon=True)
+                self._thread.start()
+
+    def reply(self, message, text):
+        self._add(message, ('reply', message, text))
+
+    def confirm_saved(self, message):
+        """Acknowledge a message that was saved as a task"""
+        self._add(message, ('saved', message, message.text))
+
+    def _add(self, message, entry):
+        with self._cond:
+            self._pending.setdefault(message.chat.id, []).append(entry)
+            self._cond.notify()
+
+    def _take_ready(self):
+        """Wait until some chat may be sent to, then return its next (message, text)"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                # A chat whose interval has passed needs no entry until it is sent to again
+                for chat_id in [chat_id for chat_id, ready_at in self._next_send.items() if ready_at <= now]:
+                    del self._next_send[chat_id]
+
+                wake_at = None
+                for chat_id in self._pending:
+                    ready_at = self._next_send.get(chat_id)
+                    if ready_at is None:
+                        self._next_send[chat_id] = now + TELEGRAM_CHAT_REPLY_INTERVAL
+                        replies = self._coalesce(self._pending.pop(chat_id))
+                        if len(replies) > 1:
+                            # One message per interval: the rest wait their turn, ahead of anything newer
+                            self._pending[chat_id] = [('reply', message, text) for message, text in replies[1:]]
+                        return replies[0]
+                    wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+                self._cond.wait(None if wake_at is None else wake_at - now)
+
+    def _run(self):
+        send_interval = 1.0 / TELEGRAM_SEND_RATE
+        last_sent = 0
+        while True:
+            message, text = self._take_ready()
+            wait = last_sent + send_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self._bot.reply_to(message, text)
+            except Exception as e:
+                safe_print(f"⚠️ Telegram reply failed: {e}")
+            last_sent = time.monotonic()
+
+    @staticmethod
+    def _coalesce(entries):
+        """Turn a chat's queued entries into (message to reply to, text) pairs, keeping their order"""
+        replies = []
+        saved = []
+
+        def flush_saved():
+            if len(saved) == 1:
+                replies.append((saved[0], f"✅ Task saved: <b>{html.escape(saved[0].text[:50])}</b>\n\n📥 Added to your General folder in TaskMaster!"))
+            elif saved:
+                titles = ''.join(f"\n• {html.escape(m.text[:50])}" for m in saved[:TELEGRAM_SAVED_LIST_LIMIT])
+                more = len(saved) - TELEGRAM_SAVED_LIST_LIMIT
+                if more > 0:
+                    titles += f"\n…and {more} more"
+                replies.append((saved[-1], f"✅ <b>{len(saved)}</b> tasks saved:{titles}\n\n📥 Added to your General folder in TaskMaster!"))
+            saved.clear()
+
+        for kind, message, text in entries:
+            if kind == 'saved':
+                saved.append(message)
+            else:
+                flush_saved()
+                replies.append((message, text))
+        flush_saved()
+        return replies
+
+telegram_outbox = TelegramOutbox()
+
+def _update_chat_id(update):
+    """Chat an update belongs to, used to keep each chat's updates in order"""
+    for kind in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        message = getattr(update, kind, None)
+        if message is not None:
+            return message.chat.id
+    callback = getattr(update, 'callback_query', None)
+    if callback is not None:
+        return callback.from_user.id
+    return update.update_id
+
+class TelegramBotRunner:
+    """Long-polls for updates in batches and runs handlers on a pool of threads.
+
+    Every update from one chat goes to the same worker, so a chat's messages
+    are handled in the order they were sent while other chats proceed in
+    parallel. Worker queues are bounded; when they fill up, polling waits.
+    """
+
+    def __init__(self, bot, workers=TELEGRAM_WORKERS):
+        self.bot = bot
+        self._queues = [queue.Queue(maxsize=TELEGRAM_WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self._stopping = threading.Event()
+
+    def run(self):
+        for index, work_queue in enumerate(self._queues):
+            threading.Thread(target=self._work, args=(work_queue,), name=f'telegram-worker-{index}', daemon=True).start()
+
+        offset = None
+        while not self._stopping.is_set():
+            try:
+                updates = self.bot.get_updates(
+                    offset=offset,
+                    limit=TELEGRAM_UPDATE_BATCH_SIZE,
+                    timeout=10,
+                    long_polling_timeout=TELEGRAM_POLL_TIMEOUT
+                )
+            except Exception as e:
+                safe_print(f"❌ Bot error: {e}")
+                self._stopping.wait(3)
+                continue
+
+            for update in updates:
+                offset = update.update_id + 1
+                self._queues[hash(_update_chat_id(update)) % len(self._queues)].put(update)
+
+        for work_queue in self._queues:
+            work_queue.put(None)
+
+    def stop(self):
+        self._stopping.set()
+
+    def _work(self, work_queue):
+        while True:
+            update = work_queue.get()
+            if update is None:
+                return
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                safe_print(f"❌ Error handling Telegram update: {e}")
 
 def setup_telegram_bot():
     """Setup the Telegram bot handlers"""
@@ -233,13 +1837,14 @@ def setup_telegram_bot():
         print("3. Set 'enabled' to true")
         return None
 
-    if not telebot_available:
+    if load_telebot() is None:
         safe_print("⚠️ telebot library not installed!")
         print("Install it with: pip install pyTelegramBotAPI")
         return None
 
     try:
-        bot = telebot.TeleBot(TELEGRAM_TOKEN, parse_mode='HTML')
+        # Handlers run on TelegramBotRunner's workers, not telebot's own thread pool
+        bot = telebot.TeleBot(TELEGRAM_TOKEN, parse_mode='HTML', threaded=False)
 
         @bot.message_handler(commands=['start'])
         def send_welcome(message):
@@ -250,7 +1855,7 @@ I'm your personal task assistant. Just send me any text and I'll save it as a ta
 
 <b>How to use:</b>
 • Send me any message → I'll save it as a task
-• When you open TaskMaster app, your tasks will be imported
+• If TaskMaster is open, it shows up right away
 • Tasks go to the "General" folder
 
 <b>Commands:</b>
@@ -260,7 +1865,7 @@ I'm your personal task assistant. Just send me any text and I'll save it as a ta
 
 💡 <i>Tip: You can send tasks while you're away, and they'll be waiting when you get home!</i>
             """
-            bot.reply_to(message, welcome_text)
+            telegram_outbox.reply(message, welcome_text)
 
         @bot.message_handler(commands=['help'])
         def send_help(message):
@@ -269,8 +1874,8 @@ I'm your personal task assistant. Just send me any text and I'll save it as a ta
 
 <b>How it works:</b>
 1. Send me any message
-2. I'll save it until you open TaskMaster
-3. When you open the app, all pending tasks are imported
+2. I'll add it to TaskMaster and confirm once it's saved
+3. Anything that couldn't be saved yet is imported the next time you open the app
 
 <b>Commands:</b>
 /start - Welcome message
@@ -279,31 +1884,22 @@ I'm your personal task assistant. Just send me any text and I'll save it as a ta
 
 <i>Just type your task and send it!</i>
             """
-            bot.reply_to(message, help_text)
+            telegram_outbox.reply(message, help_text)
 
         @bot.message_handler(commands=['tasks'])
         def show_pending_count(message):
-            count = 0
-            if os.path.exists(PENDING_TASKS_FILE):
-                try:
-                    with open(PENDING_TASKS_FILE, 'r', encoding='utf-8') as f:
-                        tasks = json.load(f)
-                        # Count only this user's tasks
-                        count = sum(1 for t in tasks if t['user_id'] == message.chat.id)
-                except:
-                    pass
+            # Count only this user's tasks: still being written, or kept in the inbox for import
+            count = telegram_ingestor.in_flight(message.chat.id) + count_pending_tasks(message.chat.id)
 
-            bot.reply_to(message, f"📝 You have <b>{count}</b> pending task(s) waiting to be imported!")
+            telegram_outbox.reply(message, f"📝 You have <b>{count}</b> pending task(s) not yet in TaskMaster!")
 
         @bot.message_handler(func=lambda message: True)
         def handle_all_messages(message):
             """Save all text messages as pending tasks"""
             if message.text and not message.text.startswith('/'):
                 username = message.chat.username or message.chat.first_name or "User"
-                save_telegram_task(message.chat.id, username, message.text)
-
-                # Send confirmation
-                bot.reply_to(message, f"✅ Task saved: <b>{message.text[:50]}</b>\n\n📥 It will be imported when you open TaskMaster!")
+                # The ingestor confirms once the task is committed
+                telegram_ingestor.submit(message, username)
 
         return bot
 
@@ -315,15 +1911,14 @@ def run_telegram_bot():
     """Run the Telegram bot in a background thread"""
     global bot
 
-    bot = setup_telegram_bot()
+    with startup_timer.phase('telegram bot setup'):
+        bot = setup_telegram_bot()
 
     if bot:
         safe_print("🤖 Telegram bot is running...")
         safe_print("💬 Send messages to your bot to save tasks!")
-        try:
-            bot.polling(non_stop=True, interval=1, timeout=60)
-        except Exception as e:
-            safe_print(f"❌ Bot error: {e}")
+        telegram_outbox.start(bot)
+        TelegramBotRunner(bot).run()
 
 @app.route('/api/telegram/import', methods=['POST'])
 def import_telegram_tasks():
@@ -339,12 +1934,350 @@ def telegram_status():
     return jsonify({
         'enabled': TELEGRAM_ENABLED,
         'configured': TELEGRAM_TOKEN != "YOUR_BOT_TOKEN_HERE",
-        'library_installed': telebot_available
+        'library_installed': telebot_installed()
     })
 
+# ============= RESPONSE CACHE =============
+
+RESPONSE_CACHE_SIZE = 256
+
+# Endpoints that write files rather than data, so they don't invalidate cached reads
+NON_DATA_ENDPOINTS = {'save_window_state_api', 'exit_app'}
+
+class ResponseCache:
+    """Serialized GET responses, valid until the next write to the database.
+
+    Writes made through this process call invalidate(). Writes from other
+    processes sharing the database file (say, the desktop app next to a
+    headless server) are caught by check_external_writes(), which watches
+    PRAGMA data_version on a connection of its own.
+    """
+
+    def __init__(self, size=RESPONSE_CACHE_SIZE):
+        self.size = size
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._watch_conn = None
+        self._data_version = None
+
+    def invalidate(self):
+        """Call after every committed write"""
+        with self._lock:
+            self._invalidate_locked()
+
+    def _invalidate_locked(self):
+        self.generation += 1
+        self._entries.clear()
+
+    def check_external_writes(self):
+        """Invalidate if anyone else committed since the last check"""
+        with self._lock:
+            if self._watch_conn is None:
+                self._watch_conn = db_pool.dedicated()
+            # data_version changes when any *other* connection commits
+            version = self._watch_conn.execute('PRAGMA data_version').fetchone()[0]
+            if version != self._data_version:
+                self._data_version = version
+                self._invalidate_locked()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, generation, entry):
+        with self._lock:
+            # Drop results computed while a write was landing; they may be stale
+            if generation != self.generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+response_cache = ResponseCache()
+
+def cached_get(view):
+    """Serve a GET endpoint from the response cache with a strong ETag.
+
+    A repeated request with a matching If-None-Match gets a 304 without
+    running the view or touching the database.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+        response_cache.check_external_writes()
+        entry = response_cache.get(key)
+
+        if entry is None:
+            generation = response_cache.generation
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            body = response.get_data()
+            entry = {
+                'body': body,
+                'etag': hashlib.sha1(body).hexdigest(),
+                'mimetype': response.mimetype,
+                'next_cursor': response.headers.get('X-Next-Cursor')
+            }
+            response_cache.put(key, generation, entry)
+
+        response = app.response_class(entry['body'], mimetype=entry['mimetype'])
+        if entry['next_cursor']:
+            response.headers['X-Next-Cursor'] = entry['next_cursor']
+        response.set_etag(entry['etag'])
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    return wrapper
+
+# ============= CHANGE FEED (SERVER-SENT EVENTS) =============
+
+EVENT_QUEUE_SIZE = 1000
+EVENT_KEEPALIVE_SECONDS = 15
+# Open /api/events streams at once; each holds a server thread for as long as it is open
+EVENT_STREAM_LIMIT = 16
+# Tells a client turned away at the limit when to try again
+EVENT_STREAM_RETRY_SECONDS = 30
+
+class ChangeFeed:
+    """Fans out change events to every connected /api/events client"""
+
+    def __init__(self, limit=EVENT_STREAM_LIMIT):
+        self.limit = limit
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    def subscribe(self):
+        """A queue of events for a new client, or None if limit clients are already connected"""
+        subscription = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        with self._lock:
+            if len(self._subscribers) >= self.limit:
+                return None
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            event['id'] = self._next_id
+            self._next_id += 1
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # Client fell too far behind: drop its backlog and tell it to reload
+                with subscription.mutex:
+                    subscription.queue.clear()
+                subscription.put_nowait({'id': event['id'], 'entity': 'all', 'action': 'resync', 'items': []})
+
+change_feed = ChangeFeed()
+
+def notify_change(entity, action, items):
+    """Invalidate cached reads and publish a change event.
+
+    entity is 'todo', 'folder' or 'note'; action is 'created', 'updated' or
+    'deleted'; items are full rows (only {'id': ...} for deletions).
+    Call after the write has been committed. Inside a request the event is
+    also returned to the client that made it (see attach_changes).
+    """
+    response_cache.invalidate()
+    if not items:
+        return
+
+    origin = request.headers.get('X-Client-Id') if has_request_context() else None
+    event = {'entity': entity, 'action': action, 'items': items, 'origin': origin}
+    change_feed.publish(event)
+    if has_request_context():
+        g.setdefault('changes', []).append(event)
+
+@app.after_request
+def attach_changes(response):
+    """Add the request's change events to its JSON reply as "changes".
+
+    The change feed skips a client's own events, so this is how the window
+    that made a write patches its lists without refetching them.
+    """
+    changes = g.pop('changes', None)
+    if changes and response.is_json:
+        body = response.get_json()
+        if isinstance(body, dict):
+            body['changes'] = changes
+            response.set_data(json.dumps(body))
+    return response
+
+@app.route('/api/events', methods=['GET'])
+def events():
+    """Stream change events to the client (Server-Sent Events)"""
+    subscription = change_feed.subscribe()
+    if subscription is None:
+        response = jsonify({'error': 'Too many open event streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(EVENT_STREAM_RETRY_SECONDS)
+        return response
+
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = subscription.get(timeout=EVENT_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"id: {event['id']}\nevent: {event['entity']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            change_feed.unsubscribe(subscription)
+
+    return app.response_class(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.after_request
+def invalidate_cache_after_write(response):
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and request.endpoint not in NON_DATA_ENDPOINTS:
+        response_cache.invalidate()
+    return response
+
+# ============= ASSETS =============
+
+FONT_FILE = 'mainfont.ttf'
+ASSET_GZIP_LEVEL = 9
+ASSET_BROTLI_QUALITY = 11
+# Compressed variants that save less than this fraction aren't worth serving
+ASSET_MIN_SAVING = 0.1
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# The unfingerprinted font URL may change content between versions
+FONT_MAX_AGE = 86400
+
+ASSET_MIMETYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+    '.ttf': 'font/ttf',
+    '.wav': 'audio/wav'
+}
+
+# Inline <style>/<script> blocks without attributes
+INLINE_BLOCK_RE = re.compile(r'<(style|script)>(.*?)</\1>', re.S)
+
+class Asset:
+    """A file held in memory with its precompressed variants"""
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.variants = {'identity': body}
+
+        compressed = {'gzip': gzip.compress(body, ASSET_GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            compressed['br'] = brotli.compress(body, quality=ASSET_BROTLI_QUALITY)
+        for encoding, data in compressed.items():
+            if len(data) <= len(body) * (1 - ASSET_MIN_SAVING):
+                self.variants[encoding] = data
+
+    def negotiate(self, accept_encodings):
+        """Smallest variant the client accepts"""
+        accepted = [e for e in self.variants if e == 'identity' or accept_encodings[e]]
+        return min(accepted, key=lambda e: len(self.variants[e]))
+
+class AssetBundle:
+    """The page with its styles and scripts moved out into fingerprinted files"""
+
+    def __init__(self, page, files):
+        self.page = page
+        self.files = files
+
+def build_assets():
+    """Render index.html once and split it into content-hashed assets.
+
+    The font and sounds are fingerprinted first so the extracted CSS/JS
+    (and therefore their hashes) point at the fingerprinted URLs.
+    """
+    with app.app_context():
+        page = render_template('index.html')
+
+    files = {}
+
+    def add(body, stem, ext):
+        asset = Asset(body, ASSET_MIMETYPES[ext])
+        name = f'{stem}.{asset.digest}{ext}'
+        files[name] = asset
+        return f'/assets/{name}'
+
+    with open(os.path.join(app.root_path, FONT_FILE), 'rb') as f:
+        urls = {f'/{FONT_FILE}': add(f.read(), 'mainfont', '.ttf')}
+    for filename in sorted(os.listdir(app.static_folder)):
+        stem, ext = os.path.splitext(filename)
+        if ext in ASSET_MIMETYPES:
+            with open(os.path.join(app.static_folder, filename), 'rb') as f:
+                urls[f'/static/{filename}'] = add(f.read(), stem, ext)
+
+    for url, fingerprinted in urls.items():
+        page = page.replace(url, fingerprinted)
+
+    def extract(match):
+        tag, body = match.group(1), match.group(2).encode('utf-8')
+        if tag == 'style':
+            return f'<link rel="stylesheet" href="{add(body, "index", ".css")}">'
+        return f'<script src="{add(body, "index", ".js")}"></script>'
+
+    page = INLINE_BLOCK_RE.sub(extract, page)
+    return AssetBundle(Asset(page.encode('utf-8'), ASSET_MIMETYPES['.html']), files)
+
+_asset_bundle = None
+_assets_lock = threading.Lock()
+
+def get_assets():
+    """The asset bundle, built on first use"""
+    global _asset_bundle
+    if _asset_bundle is None:
+        with _assets_lock:
+            if _asset_bundle is None:
+                _asset_bundle = build_assets()
+    return _asset_bundle
+
+def asset_response(asset, cache_control):
+    """Serve the best variant of an asset, or 304 if the client already has it"""
+    encoding = asset.negotiate(request.accept_encodings)
+    etag = f'{asset.digest}-{encoding}'
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(asset.variants[encoding])
+        response.headers['Content-Type'] = asset.mimetype
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # Always revalidated, so a new build is picked up; unchanged pages get a 304
+    return asset_response(get_assets().page, 'no-cache')
+
+@app.route('/assets/<name>')
+def serve_asset(name):
+    asset = get_assets().files.get(name)
+    if asset is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    return asset_response(asset, IMMUTABLE_CACHE_CONTROL)
 
 @app.route('/favicon.ico')
 def favicon():
@@ -352,39 +2285,36 @@ def favicon():
 
 @app.route('/mainfont.ttf')
 def serve_font():
-    return send_file('mainfont.ttf', mimetype='font/ttf')
+    return send_file(FONT_FILE, mimetype='font/ttf', max_age=FONT_MAX_AGE)
 
 # API Routes for Folders
 @app.route('/api/folders', methods=['GET'])
+@cached_get
 def get_folders():
-    conn = sqlite3.connect('todos.db')
+    conn = get_db()
     cursor = conn.cursor()
     
+    # Counts come from folder_counters, so this never touches the todos table
     cursor.execute('''
-        SELECT f.id, f.name, f.color, f.created_at, COUNT(t.id) as todo_count
+        SELECT f.id, f.name, f.color, f.created_at,
+               COALESCE(c.todo_count, 0), COALESCE(c.completed_count, 0)
         FROM folders f
-        LEFT JOIN todos t ON f.id = t.folder_id
-        GROUP BY f.id
+        LEFT JOIN folder_counters c ON c.folder_id = f.id
+        WHERE f.deleting = 0
         ORDER BY f.created_at ASC
     ''')
     
     folders = []
     for row in cursor.fetchall():
-        folder_id = row[0]
-        # Obtener cantidad de tareas completadas para este folder
-        cursor2 = conn.cursor()
-        cursor2.execute('SELECT COUNT(*) FROM todos WHERE folder_id = ? AND completed = 1', (folder_id,))
-        completed_count = cursor2.fetchone()[0]
         folders.append({
             'id': row[0],
             'name': row[1],
             'color': row[2],
             'created_at': row[3],
             'todo_count': row[4],
-            'completed_count': completed_count
+            'completed_count': row[5]
         })
     
-    conn.close()
     return jsonify(folders)
 
 @app.route('/api/folders', methods=['POST'])
@@ -394,117 +2324,348 @@ def create_folder():
     if not data or 'name' not in data:
         return jsonify({'error': 'Folder name is required'}), 400
     
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        cursor.execute('''
+            INSERT INTO folders (name, color)
+            VALUES (?, ?)
+        ''', (
+            data['name'],
+            data.get('color', '#667eea')
+        ))
+        return cursor.lastrowid
     
-    cursor.execute('''
-        INSERT INTO folders (name, color)
-        VALUES (?, ?)
-    ''', (
-        data['name'],
-        data.get('color', '#667eea')
-    ))
+    folder_id = db_writer.run(write)
     
-    folder_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    cursor = get_db().cursor()
+    cursor.execute('SELECT id, name, color, created_at FROM folders WHERE id = ?', (folder_id,))
+    row = cursor.fetchone()
+    notify_change('folder', 'created', [{
+        'id': row[0],
+        'name': row[1],
+        'color': row[2],
+        'created_at': row[3],
+        'todo_count': 0,
+        'completed_count': 0
+    }])
     
     return jsonify({'id': folder_id, 'message': 'Folder created successfully'}), 201
 
 @app.route('/api/folders/<int:folder_id>', methods=['DELETE'])
 def delete_folder(folder_id):
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        # Check if folder exists (one already being deleted counts as gone)
+        cursor.execute('SELECT * FROM folders WHERE id = ? AND deleting = 0', (folder_id,))
+        if not cursor.fetchone():
+            return None
+
+        cursor.execute('SELECT todo_count FROM folder_counters WHERE folder_id = ?', (folder_id,))
+        row = cursor.fetchone()
+        todo_count = row[0] if row else 0
+        if todo_count > INLINE_DELETE_LIMIT:
+            # Hide the folder now and delete its tasks in chunks
+            cursor.execute('UPDATE folders SET deleting = 1 WHERE id = ?', (folder_id,))
+            return create_job(cursor, 'delete_folder', {'folder_id': folder_id}, todo_count)
+        
+        # Delete all todos in this folder first
+        write_todos(cursor, 'DELETE FROM {table} WHERE folder_id = ?', (folder_id,))
+        
+        # Delete the folder
+        cursor.execute('DELETE FROM folders WHERE id = ?', (folder_id,))
+        return 0
     
-    # Check if folder exists
-    cursor.execute('SELECT * FROM folders WHERE id = ?', (folder_id,))
-    if not cursor.fetchone():
-        conn.close()
+    job_id = db_writer.run(write)
+    if job_id is None:
         return jsonify({'error': 'Folder not found'}), 404
+    if job_id:
+        job_runner.enqueue(job_id)
+
+        notify_change('folder', 'deleted', [{'id': folder_id}])
+        return job_accepted(job_id, 'Folder deleted; its tasks are being removed in the background')
     
-    # Delete all todos in this folder first
-    cursor.execute('DELETE FROM todos WHERE folder_id = ?', (folder_id,))
-    
-    # Delete the folder
-    cursor.execute('DELETE FROM folders WHERE id = ?', (folder_id,))
-    conn.commit()
-    conn.close()
+    # Clients drop the folder's todos themselves rather than getting one event per todo
+    notify_change('folder', 'deleted', [{'id': folder_id}])
     
     return jsonify({'message': 'Folder and all its tasks deleted successfully'})
 
+# ============= ARCHIVE STORE =============
+
+# Active todos live in todos, archived ones in todos_archive (see _create_todos_archive)
+TODO_TABLES = ('todos', 'todos_archive')
+
+def move_archived_todos(cursor):
+    """Move rows whose archived flag changed over to the table that matches it"""
+    cursor.execute(f'INSERT INTO todos_archive ({TODO_COLUMNS}) SELECT {TODO_COLUMNS} FROM todos WHERE archived = 1')
+    if cursor.rowcount:
+        cursor.execute('DELETE FROM todos WHERE archived = 1')
+    cursor.execute(f'INSERT INTO todos ({TODO_COLUMNS}) SELECT {TODO_COLUMNS} FROM todos_archive WHERE archived = 0')
+    if cursor.rowcount:
+        cursor.execute('DELETE FROM todos_archive WHERE archived = 0')
+
+def write_todos(cursor, sql, params=(), many=False):
+    """Run an UPDATE/DELETE ({table} in sql) on both todo tables; returns the rows affected.
+
+    Each id lives in exactly one table, so a row is written once. Rows are
+    only moved between the tables afterwards, once every statement has run.
+    """
+    count = 0
+    for table in TODO_TABLES:
+        statement = sql.format(table=table)
+        if many:
+            cursor.executemany(statement, params)
+        else:
+            cursor.execute(statement, params)
+        count += cursor.rowcount
+    move_archived_todos(cursor)
+    return count
+
+def todo_exists(cursor, todo_id):
+    cursor.execute('SELECT 1 FROM all_todos WHERE id = ?', (todo_id,))
+    return cursor.fetchone() is not None
+
+FOLDER_DELETING_ERROR = 'Folder is being deleted'
+
+class FolderDeleting(Exception):
+    """Raised for a write into a folder whose tasks a background job is deleting"""
+
+def check_folder_writable(cursor, folder_id):
+    """Raise FolderDeleting if folder_id is hidden while it is being deleted"""
+    cursor.execute('SELECT 1 FROM folders WHERE id = ? AND deleting = 1', (folder_id,))
+    if cursor.fetchone():
+        raise FolderDeleting(folder_id)
+
+# ============= TODO LIST HELPERS =============
+
+def _flag(value):
+    return bool(value) if value is not None else False
+
+# Every field a todo list row can carry: (API name, SQL expression, converter)
+TODO_FIELDS = [
+    ('id', 't.id', None),
+    ('title', 't.title', None),
+    ('description', 't.description', None),
+    ('completed', 't.completed', bool),
+    ('priority', 't.priority', None),
+    ('category', 't.category', None),
+    ('folder_id', 't.folder_id', None),
+    ('created_at', 't.created_at', None),
+    ('updated_at', 't.updated_at', None),
+    ('folder_name', 'f.name', lambda value: value or 'General'),
+    ('folder_color', 'f.color', lambda value: value or '#667eea'),
+    ('kanban_status', 't.kanban_status', lambda value: value or 'todo'),
+    ('added_to_today', 't.added_to_today', _flag),
+    ('today_date', 't.today_date', None),
+    ('archived', 't.archived', _flag)
+]
+TODO_FIELD_MAP = {field[0]: field for field in TODO_FIELDS}
+
+MAX_PAGE_LIMIT = 1000
+STREAM_BATCH_SIZE = 500
+
+# Sort keys (all descending) of each list; they double as the keyset cursor
+TODOS_ORDER = ['t.created_at', 't.id']
+# COALESCE keeps the keyset comparison working for rows without a today_date
+TODAY_ORDER = ["COALESCE(t.today_date, '')", 't.created_at', 't.id']
+ARCHIVED_ORDER = ['t.updated_at', 't.id']
+
+class ListQueryError(ValueError):
+    """Raised for malformed fields/limit/after list parameters"""
+
+def parse_todo_fields():
+    """Read ?fields=a,b,c (defaults to every field; id is always included)"""
+    raw = request.args.get('fields')
+    if not raw:
+        return TODO_FIELDS
+
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in TODO_FIELD_MAP]
+    if unknown:
+        raise ListQueryError(f"Unknown field(s): {', '.join(unknown)}")
+    if 'id' not in names:
+        names.insert(0, 'id')
+    return [TODO_FIELD_MAP[name] for name in dict.fromkeys(names)]
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ListQueryError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ListQueryError('Invalid cursor')
+    return values
+
+def parse_page_limit():
+    """Read ?limit= (None means the whole list, as before pagination existed)"""
+    raw = request.args.get('limit')
+    if raw is None:
+        return None
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ListQueryError('limit must be a number')
+    return min(max(limit, 1), MAX_PAGE_LIMIT)
+
+def build_todo_list_query(fields, conditions, params, order_keys, limit=None, after_values=None, source='todos'):
+    """SQL + params for one page of a todo list (fetches limit + 1 rows to detect a next page).
+
+    source is the table or view to list: todos, todos_archive or all_todos.
+    """
+    # Tasks of a folder that is being deleted in the background are already gone for clients
+    conditions = list(conditions) + ["COALESCE(f.deleting, 0) = 0"]
+    params = list(params)
+    if after_values is not None:
+        conditions.append(f"({', '.join(order_keys)}) < ({', '.join('?' * len(order_keys))})")
+        params.extend(after_values)
+
+    columns = [field[1] for field in fields] + list(order_keys)
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM {source} t
+        LEFT JOIN folders f ON t.folder_id = f.id
+        WHERE {' AND '.join(conditions) or '1=1'}
+        ORDER BY {', '.join(f'{key} DESC' for key in order_keys)}
+    """
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit + 1)
+    return query, params
+
+def fetch_todo_list(fields, query, params, limit, order_keys):
+    """Run a todo list query built by build_todo_list_query.
+
+    Returns (rows as dicts, cursor for the next page or None).
+    """
+    cursor = get_db().cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(list(rows[-1][len(fields):len(fields) + len(order_keys)]))
+
+    todos_list = [serialize_todo(fields, row) for row in rows]
+    return todos_list, next_cursor
+
+def stream_todo_list(fields, query, params):
+    """Stream a todo list as a JSON array, STREAM_BATCH_SIZE rows at a time"""
+    def generate():
+        cursor = get_db().cursor()
+        cursor.execute(query, params)
+        yield '['
+        separator = ''
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            yield separator + ','.join(
+                json.dumps(serialize_todo(fields, row), separators=(',', ':'), sort_keys=True)
+                for row in rows
+            )
+            separator = ','
+        yield ']'
+
+    # stream_with_context keeps the request (and its pooled connection) alive while streaming
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+def serialize_todo(fields, row):
+    """Turn a todo list row into its API dict"""
+    todo = {}
+    for index, (name, _, convert) in enumerate(fields):
+        todo[name] = convert(row[index]) if convert else row[index]
+    return todo
+
+def load_todos(conn, todo_ids):
+    """Full API dicts for the given todo ids (used for change events)"""
+    query, params = build_todo_list_query(
+        TODO_FIELDS, ["t.id IN (SELECT value FROM json_each(?))"], [json.dumps(list(todo_ids))], TODOS_ORDER,
+        source='all_todos'
+    )
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    return [serialize_todo(TODO_FIELDS, row) for row in cursor.fetchall()]
+
+def todo_list_response(conditions, params, order_keys, stream=False, source='todos'):
+    """JSON list response with ?fields=, ?limit= and ?after= applied.
+
+    The next page cursor goes in the X-Next-Cursor header. Unpaginated lists
+    are streamed when stream is set or the client asks for ?stream=true.
+    """
+    try:
+        fields = parse_todo_fields()
+        limit = parse_page_limit()
+        after = request.args.get('after')
+        after_values = decode_cursor(after, len(order_keys)) if after else None
+    except ListQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query, params = build_todo_list_query(fields, conditions, params, order_keys, limit, after_values, source)
+
+    if limit is None and (stream or request.args.get('stream') == 'true'):
+        return stream_todo_list(fields, query, params)
+
+    todos_list, next_cursor = fetch_todo_list(fields, query, params, limit, order_keys)
+    response = jsonify(todos_list)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
 # API Routes for Todos
 @app.route('/api/todos', methods=['GET'])
+@cached_get
 def get_todos():
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
-    
     # Get query parameters
     filter_status = request.args.get('status', 'all')
     search_query = request.args.get('search', '')
     category_filter = request.args.get('category', 'all')
     folder_filter = request.args.get('folder', 'all')
     
-    # Build query with JOIN to get folder information
-    query = """
-        SELECT t.id, t.title, t.description, t.completed, t.priority,
-               t.category, t.folder_id, t.created_at, t.updated_at,
-               f.name as folder_name, f.color as folder_color,
-               t.kanban_status, t.added_to_today, t.today_date, t.archived
-        FROM todos t
-        LEFT JOIN folders f ON t.folder_id = f.id
-        WHERE 1=1
-    """
+    # Archived tasks are left out of the normal view unless specifically requested
+    include_archived = request.args.get('include_archived') == 'true'
+    source = 'all_todos' if include_archived else 'todos'
+
+    conditions = []
     params = []
     
     if filter_status == 'completed':
-        query += " AND t.completed = 1"
+        conditions.append("t.completed = 1")
     elif filter_status == 'pending':
-        query += " AND t.completed = 0"
+        conditions.append("t.completed = 0")
     
     if search_query:
-        query += " AND (t.title LIKE ? OR t.description LIKE ?)"
-        params.extend([f'%{search_query}%', f'%{search_query}%'])
+        match_query = build_match_query(search_query)
+        if FTS_ENABLED and match_query:
+            if include_archived:
+                conditions.append(
+                    "t.id IN (SELECT rowid FROM todos_fts WHERE todos_fts MATCH ?"
+                    " UNION ALL SELECT rowid FROM todos_archive_fts WHERE todos_archive_fts MATCH ?)"
+                )
+                params.extend([match_query, match_query])
+            else:
+                conditions.append("t.id IN (SELECT rowid FROM todos_fts WHERE todos_fts MATCH ?)")
+                params.append(match_query)
+        else:
+            conditions.append("(t.title LIKE ? OR t.description LIKE ?)")
+            params.extend([f'%{search_query}%', f'%{search_query}%'])
     
     if category_filter != 'all':
-        query += " AND t.category = ?"
+        conditions.append("t.category = ?")
         params.append(category_filter)
     
     if folder_filter != 'all':
-        query += " AND t.folder_id = ?"
+        conditions.append("t.folder_id = ?")
         params.append(folder_filter)
 
-    # Exclude archived tasks from normal view (unless specifically requested)
-    if request.args.get('include_archived') != 'true':
-        query += " AND t.archived = 0"
-    
-    query += " ORDER BY t.created_at DESC"
-    
-    cursor.execute(query, params)
-    todos = cursor.fetchall()
-    
-    # Convert to list of dictionaries
-    todos_list = []
-    for todo in todos:
-        todos_list.append({
-            'id': todo[0],
-            'title': todo[1],
-            'description': todo[2],
-            'completed': bool(todo[3]),
-            'priority': todo[4],
-            'category': todo[5],
-            'folder_id': todo[6],
-            'created_at': todo[7],
-            'updated_at': todo[8],
-            'folder_name': todo[9] or 'General',
-            'folder_color': todo[10] or '#667eea',
-            'kanban_status': todo[11] or 'todo',
-            'added_to_today': bool(todo[12]) if todo[12] is not None else False,
-            'today_date': todo[13],
-            'archived': bool(todo[14]) if todo[14] is not None else False
-        })
-    
-    conn.close()
-    return jsonify(todos_list)
+    if not include_archived:
+        # Always true in todos, but lets the (archived, ...) indexes serve the query
+        conditions.append("t.archived = 0")
+
+    # Everything-including-archive lists can be huge, so stream them
+    return todo_list_response(conditions, params, TODOS_ORDER, stream=include_archived, source=source)
 
 @app.route('/api/todos', methods=['POST'])
 def create_todo():
@@ -513,119 +2674,220 @@ def create_todo():
     if not data or 'title' not in data:
         return jsonify({'error': 'Title is required'}), 400
     
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        check_folder_writable(cursor, data.get('folder_id', 1))
+        cursor.execute('''
+            INSERT INTO todos (title, description, priority, category, folder_id, kanban_status, added_to_today, today_date, archived)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            data['title'],
+            data.get('description', ''),
+            data.get('priority', 'medium'),
+            data.get('category', 'general'),
+            data.get('folder_id', 1),  # Default to General folder
+            data.get('kanban_status', 'todo'),
+            data.get('added_to_today', False),
+            data.get('today_date', None),
+            data.get('archived', False)
+        ))
+        todo_id = cursor.lastrowid
+        move_archived_todos(cursor)
+        return todo_id
     
-    cursor.execute('''
-        INSERT INTO todos (title, description, priority, category, folder_id, kanban_status, added_to_today, today_date, archived)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        data['title'],
-        data.get('description', ''),
-        data.get('priority', 'medium'),
-        data.get('category', 'general'),
-        data.get('folder_id', 1),  # Default to General folder
-        data.get('kanban_status', 'todo'),
-        data.get('added_to_today', False),
-        data.get('today_date', None),
-        data.get('archived', False)
-    ))
+    try:
+        todo_id = db_writer.run(write)
+    except FolderDeleting:
+        return jsonify({'error': FOLDER_DELETING_ERROR}), 409
     
-    todo_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'created', load_todos(get_db(), [todo_id]))
     
     return jsonify({'id': todo_id, 'message': 'Todo created successfully'}), 201
 
+# Columns a client may change through update_todo / batch_patch_todos
+TODO_UPDATABLE_FIELDS = [
+    'title', 'description', 'completed', 'priority', 'category',
+    'folder_id', 'kanban_status', 'added_to_today', 'today_date', 'archived'
+]
+
+TODO_FLAG_FIELDS = {'completed', 'added_to_today', 'archived'}
+
+def todo_field_error(name, value):
+    """Why value can't go into the todo field name, or None if it can"""
+    if name == 'title':
+        if not isinstance(value, str) or not value.strip():
+            return 'title must be a non-empty string'
+    elif name == 'kanban_status':
+        if value not in ['todo', 'doing', 'done']:
+            return 'kanban_status must be todo, doing, or done'
+    elif name in TODO_FLAG_FIELDS:
+        if value not in (True, False):
+            return f'{name} must be true or false'
+    elif name == 'folder_id':
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            return 'folder_id must be an integer or null'
+    elif name in ('priority', 'category'):
+        if not isinstance(value, str):
+            return f'{name} must be a string'
+    elif value is not None and not isinstance(value, str):
+        return f'{name} must be a string or null'
+    return None
+
 @app.route('/api/todos/<int:todo_id>', methods=['PUT'])
 def update_todo(todo_id):
     data = request.get_json()
     
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
-    
-    # Check if todo exists
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    if not cursor.fetchone():
-        conn.close()
-        return jsonify({'error': 'Todo not found'}), 404
-    
-    # Update todo
-    update_fields = []
-    params = []
-    
-    if 'title' in data:
-        update_fields.append('title = ?')
-        params.append(data['title'])
-    
-    if 'description' in data:
-        update_fields.append('description = ?')
-        params.append(data['description'])
-    
-    if 'completed' in data:
-        update_fields.append('completed = ?')
-        params.append(data['completed'])
-    
-    if 'priority' in data:
-        update_fields.append('priority = ?')
-        params.append(data['priority'])
-    
-    if 'category' in data:
-        update_fields.append('category = ?')
-        params.append(data['category'])
-    
-    if 'folder_id' in data:
-        update_fields.append('folder_id = ?')
-        params.append(data['folder_id'])
-
-    if 'kanban_status' in data:
-        update_fields.append('kanban_status = ?')
-        params.append(data['kanban_status'])
-
-    if 'added_to_today' in data:
-        update_fields.append('added_to_today = ?')
-        params.append(data['added_to_today'])
-
-    if 'today_date' in data:
-        update_fields.append('today_date = ?')
-        params.append(data['today_date'])
-
-    if 'archived' in data:
-        update_fields.append('archived = ?')
-        params.append(data['archived'])
+    def write(cursor):
+        # Check if todo exists
+        if not todo_exists(cursor, todo_id):
+            return False
+        if 'folder_id' in data:
+            check_folder_writable(cursor, data['folder_id'])
+        
+        # Update todo
+        update_fields = []
+        params = []
+        
+        for field in TODO_UPDATABLE_FIELDS:
+            if field in data:
+                update_fields.append(f'{field} = ?')
+                params.append(data[field])
+        
+        update_fields.append('updated_at = CURRENT_TIMESTAMP')
+        params.append(todo_id)
+        
+        write_todos(cursor, f"UPDATE {{table}} SET {', '.join(update_fields)} WHERE id = ?", params)
+        return True
     
-    update_fields.append('updated_at = CURRENT_TIMESTAMP')
-    params.append(todo_id)
+    try:
+        if not db_writer.run(write):
+            return jsonify({'error': 'Todo not found'}), 404
+    except FolderDeleting:
+        return jsonify({'error': FOLDER_DELETING_ERROR}), 409
     
-    query = f"UPDATE todos SET {', '.join(update_fields)} WHERE id = ?"
-    cursor.execute(query, params)
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'updated', load_todos(get_db(), [todo_id]))
     
     return jsonify({'message': 'Todo updated successfully'})
 
 @app.route('/api/todos/<int:todo_id>', methods=['DELETE'])
 def delete_todo(todo_id):
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        # Check if todo exists
+        if not todo_exists(cursor, todo_id):
+            return False
+        write_todos(cursor, 'DELETE FROM {table} WHERE id = ?', (todo_id,))
+        return True
     
-    # Check if todo exists
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    if not cursor.fetchone():
-        conn.close()
+    if not db_writer.run(write):
         return jsonify({'error': 'Todo not found'}), 404
     
-    cursor.execute('DELETE FROM todos WHERE id = ?', (todo_id,))
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'deleted', [{'id': todo_id}])
     
     return jsonify({'message': 'Todo deleted successfully'})
 
+# ============= SEARCH API =============
+
+# Markers FTS5 wraps around matches; swapped for <mark> after HTML escaping
+HIGHLIGHT_OPEN = '\ue000'
+HIGHLIGHT_CLOSE = '\ue001'
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word is a prefix match"""
+    terms = []
+    for word in text.split():
+        word = word.replace('"', '')
+        if word:
+            terms.append(f'"{word}"*')
+    return ' '.join(terms)
+
+def render_highlight(text):
+    """HTML-escape an FTS5 highlight/snippet and turn its markers into <mark> tags"""
+    if text is None:
+        return None
+    return html.escape(text).replace(HIGHLIGHT_OPEN, '<mark>').replace(HIGHLIGHT_CLOSE, '</mark>')
+
+@app.route('/api/search', methods=['GET'])
+@cached_get
+def search():
+    """Search todos and notes together, best matches (bm25) first"""
+    match_query = build_match_query(request.args.get('q', ''))
+    if not match_query:
+        return jsonify([])
+
+    if not FTS_ENABLED:
+        return jsonify({'error': 'Full-text search is not available'}), 503
+
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+
+    conn = get_db()
+    cursor = conn.cursor()
+
+    # Title matches weigh more than description matches
+    cursor.execute('''
+        SELECT 'todo', t.id,
+               highlight(todos_fts, 0, ?, ?),
+               snippet(todos_fts, 1, ?, ?, '…', 16),
+               t.completed, t.archived, t.folder_id,
+               bm25(todos_fts, 10.0, 1.0) AS rank
+        FROM todos_fts
+        JOIN todos t ON t.id = todos_fts.rowid
+        WHERE todos_fts MATCH ?
+          AND NOT EXISTS (SELECT 1 FROM folders f WHERE f.id = t.folder_id AND f.deleting = 1)
+        UNION ALL
+        SELECT 'todo', t.id,
+               highlight(todos_archive_fts, 0, ?, ?),
+               snippet(todos_archive_fts, 1, ?, ?, '…', 16),
+               t.completed, t.archived, t.folder_id,
+               bm25(todos_archive_fts, 10.0, 1.0) AS rank
+        FROM todos_archive_fts
+        JOIN todos_archive t ON t.id = todos_archive_fts.rowid
+        WHERE todos_archive_fts MATCH ?
+          AND NOT EXISTS (SELECT 1 FROM folders f WHERE f.id = t.folder_id AND f.deleting = 1)
+        UNION ALL
+        SELECT 'note', n.id,
+               NULL,
+               snippet(notes_fts, 0, ?, ?, '…', 16),
+               NULL, NULL, NULL,
+               bm25(notes_fts) AS rank
+        FROM notes_fts
+        JOIN notes n ON n.id = notes_fts.rowid
+        WHERE notes_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    ''', (
+        HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, match_query,
+        HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, match_query,
+        HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, match_query,
+        limit
+    ))
+
+    results = []
+    for row in cursor.fetchall():
+        result = {
+            'type': row[0],
+            'id': row[1],
+            'snippet': render_highlight(row[3]),
+            'rank': row[7]
+        }
+        if row[0] == 'todo':
+            result.update({
+                'title': render_highlight(row[2]),
+                'completed': bool(row[4]),
+                'archived': bool(row[5]) if row[5] is not None else False,
+                'folder_id': row[6]
+            })
+        results.append(result)
+
+    return jsonify(results)
+
 # ============= NOTES API =============
 
 @app.route('/api/notes', methods=['GET'])
+@cached_get
 def get_notes():
-    conn = sqlite3.connect('todos.db')
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute('SELECT id, content, created_at, updated_at FROM notes ORDER BY created_at DESC')
     notes = [{
@@ -634,7 +2896,6 @@ def get_notes():
         'created_at': row[2],
         'updated_at': row[3]
     } for row in cursor.fetchall()]
-    conn.close()
     return jsonify(notes)
 
 @app.route('/api/notes', methods=['POST'])
@@ -645,160 +2906,85 @@ def create_note():
     if not content:
         return jsonify({'error': 'Content is required'}), 400
 
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO notes (content) VALUES (?)', (content,))
-    note_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    def write(cursor):
+        cursor.execute('INSERT INTO notes (content) VALUES (?)', (content,))
+        return cursor.lastrowid
+
+    note_id = db_writer.run(write)
+
+    cursor = get_db().cursor()
+    cursor.execute('SELECT id, content, created_at, updated_at FROM notes WHERE id = ?', (note_id,))
+    row = cursor.fetchone()
+    notify_change('note', 'created', [{
+        'id': row[0],
+        'content': row[1],
+        'created_at': row[2],
+        'updated_at': row[3]
+    }])
 
     return jsonify({'id': note_id, 'message': 'Note created successfully'}), 201
 
 @app.route('/api/notes/<int:note_id>', methods=['DELETE'])
 def delete_note(note_id):
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
+        return cursor.rowcount
 
-    # Check if note exists
-    cursor.execute('SELECT * FROM notes WHERE id = ?', (note_id,))
-    if not cursor.fetchone():
-        conn.close()
+    if not db_writer.run(write):
         return jsonify({'error': 'Note not found'}), 404
 
-    cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
-    conn.commit()
-    conn.close()
+    notify_change('note', 'deleted', [{'id': note_id}])
 
     return jsonify({'message': 'Note deleted successfully'})
 
 @app.route('/api/todos/<int:todo_id>/toggle', methods=['PUT'])
 def toggle_todo(todo_id):
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        # Check if todo exists
+        cursor.execute('SELECT completed FROM all_todos WHERE id = ?', (todo_id,))
+        result = cursor.fetchone()
+        if not result:
+            return None
+        
+        # Toggle completed status
+        new_status = not result[0]
+        write_todos(cursor, '''
+            UPDATE {table}
+            SET completed = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (new_status, todo_id))
+        return new_status
     
-    # Check if todo exists
-    cursor.execute('SELECT completed FROM todos WHERE id = ?', (todo_id,))
-    result = cursor.fetchone()
-    if not result:
-        conn.close()
+    new_status = db_writer.run(write)
+    if new_status is None:
         return jsonify({'error': 'Todo not found'}), 404
     
-    # Toggle completed status
-    new_status = not result[0]
-    cursor.execute('''
-        UPDATE todos 
-        SET completed = ?, updated_at = CURRENT_TIMESTAMP 
-        WHERE id = ?
-    ''', (new_status, todo_id))
-    
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'updated', load_todos(get_db(), [todo_id]))
     
     return jsonify({'completed': new_status, 'message': 'Todo toggled successfully'})
 
 # API Routes for Today View
 @app.route('/api/todos/today', methods=['GET'])
+@cached_get
 def get_today_todos():
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
-
     # Check if we should include completed/archived tasks
     include_completed = request.args.get('include_completed', 'false').lower() == 'true'
 
-    # Build query based on include_completed flag
+    conditions = ["t.added_to_today = 1"]
     if include_completed:
-        # Get ALL tasks added to today (including done/archived)
-        query = """
-            SELECT t.id, t.title, t.description, t.completed, t.priority,
-                   t.category, t.folder_id, t.created_at, t.updated_at,
-                   f.name as folder_name, f.color as folder_color,
-                   t.kanban_status, t.added_to_today, t.today_date, t.archived
-            FROM todos t
-            LEFT JOIN folders f ON t.folder_id = f.id
-            WHERE t.added_to_today = 1
-            ORDER BY t.today_date DESC, t.created_at DESC
-        """
+        source = 'all_todos'
     else:
         # Get only active tasks (not archived)
-        query = """
-            SELECT t.id, t.title, t.description, t.completed, t.priority,
-                   t.category, t.folder_id, t.created_at, t.updated_at,
-                   f.name as folder_name, f.color as folder_color,
-                   t.kanban_status, t.added_to_today, t.today_date, t.archived
-            FROM todos t
-            LEFT JOIN folders f ON t.folder_id = f.id
-            WHERE t.added_to_today = 1 AND t.archived = 0
-            ORDER BY t.today_date DESC, t.created_at DESC
-        """
-
-    cursor.execute(query)
-    todos = cursor.fetchall()
-
-    todos_list = []
-    for todo in todos:
-        todos_list.append({
-            'id': todo[0],
-            'title': todo[1],
-            'description': todo[2],
-            'completed': bool(todo[3]),
-            'priority': todo[4],
-            'category': todo[5],
-            'folder_id': todo[6],
-            'created_at': todo[7],
-            'updated_at': todo[8],
-            'folder_name': todo[9] or 'General',
-            'folder_color': todo[10] or '#667eea',
-            'kanban_status': todo[11] or 'todo',
-            'added_to_today': bool(todo[12]) if todo[12] is not None else False,
-            'today_date': todo[13],
-            'archived': bool(todo[14]) if todo[14] is not None else False
-        })
+        source = 'todos'
+        conditions.append("t.archived = 0")
 
-    conn.close()
-    return jsonify(todos_list)
+    return todo_list_response(conditions, [], TODAY_ORDER, source=source)
 
 # API Routes for Archived Todos
 @app.route('/api/todos/archived', methods=['GET'])
+@cached_get
 def get_archived_todos():
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
-
-    query = """
-        SELECT t.id, t.title, t.description, t.completed, t.priority,
-               t.category, t.folder_id, t.created_at, t.updated_at,
-               f.name as folder_name, f.color as folder_color,
-               t.kanban_status, t.added_to_today, t.today_date, t.archived
-        FROM todos t
-        LEFT JOIN folders f ON t.folder_id = f.id
-        WHERE t.archived = 1
-        ORDER BY t.updated_at DESC
-    """
-
-    cursor.execute(query)
-    todos = cursor.fetchall()
-
-    todos_list = []
-    for todo in todos:
-        todos_list.append({
-            'id': todo[0],
-            'title': todo[1],
-            'description': todo[2],
-            'completed': bool(todo[3]),
-            'priority': todo[4],
-            'category': todo[5],
-            'folder_id': todo[6],
-            'created_at': todo[7],
-            'updated_at': todo[8],
-            'folder_name': todo[9] or 'General',
-            'folder_color': todo[10] or '#667eea',
-            'kanban_status': todo[11] or 'todo',
-            'added_to_today': bool(todo[12]) if todo[12] is not None else False,
-            'today_date': todo[13],
-            'archived': bool(todo[14]) if todo[14] is not None else False
-        })
-
-    conn.close()
-    return jsonify(todos_list)
+    return todo_list_response([], [], ARCHIVED_ORDER, source='todos_archive')
 
 @app.route('/api/todos/<int:todo_id>/kanban-status', methods=['PUT'])
 def update_kanban_status(todo_id):
@@ -810,32 +2996,31 @@ def update_kanban_status(todo_id):
     if data['status'] not in ['todo', 'doing', 'done']:
         return jsonify({'error': 'Invalid status. Must be todo, doing, or done'}), 400
 
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        # Check if todo exists
+        if not todo_exists(cursor, todo_id):
+            return False
+
+        # Update kanban status
+        # If status is 'done', also mark as completed and archived
+        if data['status'] == 'done':
+            write_todos(cursor, '''
+                UPDATE {table}
+                SET kanban_status = ?, completed = 1, archived = 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (data['status'], todo_id))
+        else:
+            write_todos(cursor, '''
+                UPDATE {table}
+                SET kanban_status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (data['status'], todo_id))
+        return True
 
-    # Check if todo exists
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    if not cursor.fetchone():
-        conn.close()
+    if not db_writer.run(write):
         return jsonify({'error': 'Todo not found'}), 404
 
-    # Update kanban status
-    # If status is 'done', also mark as completed and archived
-    if data['status'] == 'done':
-        cursor.execute('''
-            UPDATE todos
-            SET kanban_status = ?, completed = 1, archived = 1, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (data['status'], todo_id))
-    else:
-        cursor.execute('''
-            UPDATE todos
-            SET kanban_status = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (data['status'], todo_id))
-
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'updated', load_todos(get_db(), [todo_id]))
 
     return jsonify({'message': 'Kanban status updated successfully'})
 
@@ -856,119 +3041,105 @@ def batch_update_kanban_status():
     if status not in ['todo', 'doing', 'done']:
         return jsonify({'error': 'Invalid status. Must be todo, doing, or done'}), 400
 
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
-
     # Update kanban status for all todos
     placeholders = ','.join('?' * len(todo_ids))
 
     # If status is 'done', also mark as completed and archived
     if status == 'done':
         query = f'''
-            UPDATE todos
+            UPDATE {{table}}
             SET kanban_status = ?, completed = 1, archived = 1, updated_at = CURRENT_TIMESTAMP
             WHERE id IN ({placeholders})
         '''
-        cursor.execute(query, [status] + todo_ids)
     else:
         query = f'''
-            UPDATE todos
+            UPDATE {{table}}
             SET kanban_status = ?, completed = 0, archived = 0, updated_at = CURRENT_TIMESTAMP
             WHERE id IN ({placeholders})
         '''
-        cursor.execute(query, [status] + todo_ids)
+    updated_count = db_writer.run(write_todos, query, [status] + todo_ids)
 
-    updated_count = cursor.rowcount
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'updated', load_todos(get_db(), todo_ids))
 
     return jsonify({'message': f'{updated_count} task(s) updated successfully', 'count': updated_count})
 
 @app.route('/api/todos/<int:todo_id>/add-to-today', methods=['PUT'])
 def add_to_today(todo_id):
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        # Check if todo exists
+        if not todo_exists(cursor, todo_id):
+            return False
+        write_todos(cursor, '''
+            UPDATE {table}
+            SET added_to_today = 1, today_date = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (todo_id,))
+        return True
 
-    # Check if todo exists
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    if not cursor.fetchone():
-        conn.close()
+    if not db_writer.run(write):
         return jsonify({'error': 'Todo not found'}), 404
 
-    cursor.execute('''
-        UPDATE todos
-        SET added_to_today = 1, today_date = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (todo_id,))
-
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'updated', load_todos(get_db(), [todo_id]))
 
     return jsonify({'message': 'Todo added to Today successfully'})
 
 @app.route('/api/todos/<int:todo_id>/remove-from-today', methods=['PUT'])
 def remove_from_today(todo_id):
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        # Check if todo exists
+        if not todo_exists(cursor, todo_id):
+            return False
+        write_todos(cursor, '''
+            UPDATE {table}
+            SET added_to_today = 0, today_date = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (todo_id,))
+        return True
 
-    # Check if todo exists
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    if not cursor.fetchone():
-        conn.close()
+    if not db_writer.run(write):
         return jsonify({'error': 'Todo not found'}), 404
 
-    cursor.execute('''
-        UPDATE todos
-        SET added_to_today = 0, today_date = NULL, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (todo_id,))
-
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'updated', load_todos(get_db(), [todo_id]))
 
     return jsonify({'message': 'Todo removed from Today successfully'})
 
 @app.route('/api/todos/<int:todo_id>/archive', methods=['PUT'])
 def archive_todo(todo_id):
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        # Check if todo exists
+        if not todo_exists(cursor, todo_id):
+            return False
+        write_todos(cursor, '''
+            UPDATE {table}
+            SET archived = 1, completed = 1, kanban_status = 'done', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (todo_id,))
+        return True
 
-    # Check if todo exists
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    if not cursor.fetchone():
-        conn.close()
+    if not db_writer.run(write):
         return jsonify({'error': 'Todo not found'}), 404
 
-    cursor.execute('''
-        UPDATE todos
-        SET archived = 1, completed = 1, kanban_status = 'done', updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (todo_id,))
-
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'updated', load_todos(get_db(), [todo_id]))
 
     return jsonify({'message': 'Todo archived successfully'})
 
 @app.route('/api/todos/<int:todo_id>/unarchive', methods=['PUT'])
 def unarchive_todo(todo_id):
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
+    def write(cursor):
+        # Check if todo exists
+        if not todo_exists(cursor, todo_id):
+            return False
+        write_todos(cursor, '''
+            UPDATE {table}
+            SET archived = 0, completed = 0, kanban_status = 'todo', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (todo_id,))
+        return True
 
-    # Check if todo exists
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    if not cursor.fetchone():
-        conn.close()
+    if not db_writer.run(write):
         return jsonify({'error': 'Todo not found'}), 404
 
-    cursor.execute('''
-        UPDATE todos
-        SET archived = 0, completed = 0, kanban_status = 'todo', updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (todo_id,))
-
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'updated', load_todos(get_db(), [todo_id]))
 
     return jsonify({'message': 'Todo unarchived successfully'})
 
@@ -985,21 +3156,111 @@ def batch_delete_todos():
     if not isinstance(todo_ids, list) or len(todo_ids) == 0:
         return jsonify({'error': 'IDs must be a non-empty list'}), 400
 
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
-
-    # Use placeholders for all IDs
-    placeholders = ','.join('?' * len(todo_ids))
-    query = f'DELETE FROM todos WHERE id IN ({placeholders})'
+    if len(todo_ids) > INLINE_DELETE_LIMIT:
+        job_id = db_writer.run(create_job, 'delete_todos', {'ids': todo_ids}, len(todo_ids))
+        job_runner.enqueue(job_id)
+        return job_accepted(job_id, f'{len(todo_ids)} todo(s) are being deleted in the background')
 
-    cursor.execute(query, todo_ids)
-    deleted_count = cursor.rowcount
+    deleted_count = db_writer.run(write_todos, 'DELETE FROM {table} WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(todo_ids),))
 
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'deleted', [{'id': todo_id} for todo_id in todo_ids])
 
     return jsonify({'message': f'{deleted_count} todo(s) deleted successfully', 'count': deleted_count})
 
+@app.route('/api/todos/batch', methods=['PATCH'])
+def batch_patch_todos():
+    """Apply a list of {id, field: value, ...} patches in one transaction.
+
+    Patches with the same set of fields are applied together with
+    executemany. Returns one result per distinct id, in request order;
+    a patch the database refuses fails only its own id.
+    """
+    data = request.get_json()
+    patches = data.get('patches') if isinstance(data, dict) else data
+    if not isinstance(patches, list) or len(patches) == 0:
+        return jsonify({'error': 'A non-empty list of patches is required'}), 400
+
+    results = {}
+    changes = {}
+    for patch in patches:
+        if not isinstance(patch, dict) or not isinstance(patch.get('id'), int):
+            return jsonify({'error': 'Every patch must be an object with an integer id'}), 400
+
+        todo_id = patch['id']
+        fields = {key: value for key, value in patch.items() if key != 'id'}
+        unknown = [key for key in fields if key not in TODO_UPDATABLE_FIELDS]
+        if results.get(todo_id, {}).get('status') == 'invalid':
+            continue
+        if unknown:
+            error = f"Unknown field(s): {', '.join(unknown)}"
+        elif not fields:
+            error = 'No fields to update'
+        else:
+            error = next(filter(None, (todo_field_error(name, value) for name, value in fields.items())), None)
+        if error:
+            # One bad patch rejects every patch for that id
+            results[todo_id] = {'id': todo_id, 'status': 'invalid', 'error': error}
+            changes.pop(todo_id, None)
+        else:
+            # Several patches for one id are merged; later values win
+            changes.setdefault(todo_id, {}).update(fields)
+            results[todo_id] = {'id': todo_id, 'status': 'updated'}
+
+    def write(cursor):
+        cursor.execute('SELECT id FROM all_todos WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(list(changes)),))
+        existing_ids = {row[0] for row in cursor.fetchall()}
+        for todo_id in list(changes):
+            if todo_id not in existing_ids:
+                del changes[todo_id]
+                results[todo_id] = {'id': todo_id, 'status': 'not_found'}
+
+        target_folders = {fields['folder_id'] for fields in changes.values() if 'folder_id' in fields}
+        if target_folders:
+            cursor.execute('SELECT id FROM folders WHERE deleting = 1 AND id IN (SELECT value FROM json_each(?))',
+                           (json.dumps(list(target_folders)),))
+            deleting = {row[0] for row in cursor.fetchall()}
+            for todo_id in [todo_id for todo_id, fields in changes.items() if fields.get('folder_id') in deleting]:
+                del changes[todo_id]
+                results[todo_id] = {'id': todo_id, 'status': 'conflict', 'error': FOLDER_DELETING_ERROR}
+
+        # One UPDATE statement per distinct set of fields
+        groups = {}
+        for todo_id, fields in changes.items():
+            names = tuple(sorted(fields))
+            groups.setdefault(names, []).append([fields[name] for name in names] + [todo_id])
+
+        def apply(query, rows, many):
+            """Run one update inside a savepoint; returns the error if the database refused it"""
+            cursor.execute('SAVEPOINT patch')
+            try:
+                write_todos(cursor, query, rows, many=many)
+            except sqlite3.Error as e:
+                cursor.execute('ROLLBACK TO patch')
+                return e
+            finally:
+                cursor.execute('RELEASE patch')
+            return None
+
+        for names, rows in groups.items():
+            assignments = ', '.join(f'{name} = ?' for name in names)
+            query = f'UPDATE {{table}} SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?'
+            if apply(query, rows, many=True) is None:
+                continue
+            # Something in the group was refused: apply its rows one by one to find which
+            for row in rows:
+                error = apply(query, row, many=False)
+                if error is not None:
+                    todo_id = row[-1]
+                    del changes[todo_id]
+                    results[todo_id] = {'id': todo_id, 'status': 'failed', 'error': str(error)}
+
+    db_writer.run(write)
+
+    if changes:
+        notify_change('todo', 'updated', load_todos(get_db(), changes))
+
+    return jsonify({'results': list(results.values()), 'count': len(changes)})
+
 @app.route('/api/todos/batch/move', methods=['PUT'])
 def batch_move_todos():
     """Move multiple todos to a folder at once"""
@@ -1013,24 +3274,28 @@ def batch_move_todos():
     if not isinstance(todo_ids, list) or len(todo_ids) == 0:
         return jsonify({'error': 'IDs must be a non-empty list'}), 400
 
-    conn = sqlite3.connect('todos.db')
-    cursor = conn.cursor()
-
-    # Verify folder exists
-    cursor.execute('SELECT * FROM folders WHERE id = ?', (folder_id,))
-    if not cursor.fetchone():
-        conn.close()
-        return jsonify({'error': 'Folder not found'}), 404
-
     # Update all todos
     placeholders = ','.join('?' * len(todo_ids))
-    query = f'UPDATE todos SET folder_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id IN ({placeholders})'
+    query = f'UPDATE {{table}} SET folder_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id IN ({placeholders})'
+
+    def write(cursor):
+        # Verify folder exists
+        cursor.execute('SELECT deleting FROM folders WHERE id = ?', (folder_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        if row[0]:
+            raise FolderDeleting(folder_id)
+        return write_todos(cursor, query, [folder_id] + todo_ids)
 
-    cursor.execute(query, [folder_id] + todo_ids)
-    updated_count = cursor.rowcount
+    try:
+        updated_count = db_writer.run(write)
+    except FolderDeleting:
+        return jsonify({'error': FOLDER_DELETING_ERROR}), 409
+    if updated_count is None:
+        return jsonify({'error': 'Folder not found'}), 404
 
-    conn.commit()
-    conn.close()
+    notify_change('todo', 'updated', load_todos(get_db(), todo_ids))
 
     return jsonify({'message': f'{updated_count} todo(s) moved successfully', 'count': updated_count})
 
@@ -1053,118 +3318,1247 @@ def save_window_state_api():
     try:
         data = request.get_json()
         if data:
-            # Validate and clamp values
-            state = {
-                'width': min(max(data.get('width', 1100), 800), 3840),
-                'height': min(max(data.get('height', 800), 600), 2160),
-                'x': max(0, data.get('x', 100)),
-                'y': max(0, data.get('y', 100))
-            }
-            with open(WINDOW_STATE_FILE, 'w') as f:
-                json.dump(state, f)
+            # Validate and clamp values; the file is written later, and only if something changed
+            window_settings.update(clamp_window_state(data))
             return jsonify({'message': 'Window state saved'})
     except Exception as e:
         safe_print(f"Error saving window state via API: {e}")
     return jsonify({'message': 'Failed to save window state'}), 400
 
 @app.route('/api/stats')
+@cached_get
 def get_stats():
-    conn = sqlite3.connect('todos.db')
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Get total todos
-    cursor.execute('SELECT COUNT(*) FROM todos')
-    total = cursor.fetchone()[0]
+    # Read both tables inside one transaction so the numbers agree with each other
+    cursor.execute('BEGIN')
     
-    # Get completed todos
-    cursor.execute('SELECT COUNT(*) FROM todos WHERE completed = 1')
-    completed = cursor.fetchone()[0]
-    
-    # Get pending todos
-    cursor.execute('SELECT COUNT(*) FROM todos WHERE completed = 0')
-    pending = cursor.fetchone()[0]
-    
-    # Get todos by priority
-    cursor.execute('SELECT priority, COUNT(*) FROM todos GROUP BY priority')
-    priority_stats = dict(cursor.fetchall())
-    
-    # Get todos by category
-    cursor.execute('SELECT category, COUNT(*) FROM todos GROUP BY category')
-    category_stats = dict(cursor.fetchall())
+    # Totals, priorities and categories are kept up to date by triggers
+    cursor.execute('SELECT dimension, key, count FROM todo_stats')
+    counts = {(dimension, key): count for dimension, key, count in cursor.fetchall()}
+
+    # The triggers still count tasks of folders being deleted in the background; take them out
+    cursor.execute('SELECT id FROM folders WHERE deleting = 1')
+    hidden_folders = [row[0] for row in cursor.fetchall()]
+    hidden_counts = []
+    if hidden_folders:
+        cursor.execute(' UNION ALL '.join(f'''
+            SELECT completed, COALESCE(priority, ''), COALESCE(category, ''), COUNT(*)
+            FROM {table}
+            WHERE folder_id IN (SELECT value FROM json_each(?))
+            GROUP BY 1, 2, 3
+        ''' for table in TODO_TABLES), [json.dumps(hidden_folders)] * len(TODO_TABLES))
+        hidden_counts = cursor.fetchall()
+    for completed, priority, category, count in hidden_counts:
+        for key in (('status', 'total'), ('status', 'completed' if completed else 'pending'),
+                    ('priority', priority), ('category', category)):
+            counts[key] = counts.get(key, 0) - count
+
+    status_stats = {'total': 0, 'completed': 0, 'pending': 0}
+    priority_stats = {}
+    category_stats = {}
+    for (dimension, key), count in counts.items():
+        if dimension == 'status':
+            status_stats[key] = count
+        elif count > 0:
+            if dimension == 'priority':
+                priority_stats[key] = count
+            elif dimension == 'category':
+                category_stats[key] = count
     
     # Get todos by folder
     cursor.execute('''
-        SELECT f.name, COUNT(t.id) 
-        FROM folders f 
-        LEFT JOIN todos t ON f.id = t.folder_id 
-        GROUP BY f.id
+        SELECT f.name, COALESCE(c.todo_count, 0)
+        FROM folders f
+        LEFT JOIN folder_counters c ON c.folder_id = f.id
+        WHERE f.deleting = 0
     ''')
     folder_stats = dict(cursor.fetchall())
     
-    conn.close()
+    conn.commit()
     
     return jsonify({
-        'total': total,
-        'completed': completed,
-        'pending': pending,
+        'total': status_stats['total'],
+        'completed': status_stats['completed'],
+        'pending': status_stats['pending'],
         'priority_stats': priority_stats,
         'category_stats': category_stats,
         'folder_stats': folder_stats
     })
 
-def start_flask():
-    app.run(debug=False, host='127.0.0.1', port=5000, use_reloader=False)
+# ============= BACKGROUND JOBS =============
+
+# Rows a job step deletes in one transaction
+JOB_CHUNK_SIZE = 500
+# Deletes up to this many rows run inside the request; bigger ones become a job (202 Accepted)
+INLINE_DELETE_LIMIT = JOB_CHUNK_SIZE
+# Shortest break between steps, so waiting writers can take the lock
+JOB_MIN_PAUSE_SECONDS = 0.005
+# Finished jobs kept for GET /api/jobs
+JOB_HISTORY = 100
+# Threads running jobs, so an export doesn't wait behind a big delete
+JOB_WORKERS = 2
+# A running job whose owner hasn't saved progress for this long is taken to be orphaned
+JOB_STALE_SECONDS = 60
+# How often a runner looks for orphaned jobs to take over
+JOB_POLL_SECONDS = 15
+
+def _delete_folder_step(cursor, job):
+    """Delete the next chunk of the folder's tasks, and the folder once none are left"""
+    folder_id = job['params']['folder_id']
+    deleted = write_todos(
+        cursor,
+        'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE folder_id = ? LIMIT ?)',
+        (folder_id, JOB_CHUNK_SIZE)
+    )
+    if not deleted:
+        cursor.execute('DELETE FROM folders WHERE id = ?', (folder_id,))
+    # Clients dropped the folder's tasks when it was hidden, so there is nothing to announce
+    return deleted, []
+
+def _delete_folder_cancel(cursor, job):
+    """Bring the folder back with whatever tasks it still has"""
+    folder_id = job['params']['folder_id']
+    cursor.execute('UPDATE folders SET deleting = 0 WHERE id = ?', (folder_id,))
+    return [('all', 'resync', [{'id': folder_id}])]
+
+def _delete_todos_step(cursor, job):
+    """Delete the next JOB_CHUNK_SIZE ids of the batch"""
+    chunk = job['params']['ids'][job['done']:job['done'] + JOB_CHUNK_SIZE]
+    if chunk:
+        write_todos(cursor, 'DELETE FROM {table} WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(chunk),))
+    return len(chunk), [('todo', 'deleted', [{'id': todo_id} for todo_id in chunk])]
+
+# kind -> (step, cancel). step(cursor, job) does one chunk without committing and returns
+# (progress made, change events); 0 progress means the job is finished. job is a dict with
+# the job's params, done, position (step state, saved with each step) and result.
+# cancel(cursor, job) undoes any up-front effects (also on failure) and returns change events.
+JOB_KINDS = {
+    'delete_folder': (_delete_folder_step, _delete_folder_cancel),
+    'delete_todos': (_delete_todos_step, None)
+}
+
+def create_job(cursor, kind, params, total):
+    """Record a job in the caller's transaction; enqueue it with job_runner once committed"""
+    cursor.execute('''
+        DELETE FROM jobs
+        WHERE state IN ('done', 'cancelled', 'failed') AND id <= (SELECT MAX(id) FROM jobs) - ?
+    ''', (JOB_HISTORY,))
+    cursor.execute(
+        'INSERT INTO jobs (kind, params, total) VALUES (?, ?, ?)',
+        (kind, json.dumps(params, separators=(',', ':')), total)
+    )
+    return cursor.lastrowid
+
+def job_accepted(job_id, message):
+    """202 response pointing at the job's status URL"""
+    response = jsonify({'job_id': job_id, 'message': message})
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job_id}'
+    return response
+
+# Kinds whose steps only read: they run on the job's own connection, keeping
+# the writer free, and only their progress goes through db_writer
+READ_ONLY_JOB_KINDS = {'export'}
+
+def _owner_exited(owner):
+    """True if a job owner's process (on this machine) is gone; unknown counts as alive"""
+    if sys.platform == 'win32':
+        # os.kill(pid, 0) would terminate the process there; rely on the heartbeat
+        return False
+    try:
+        os.kill(int(owner.split('-')[0]), 0)
+    except ProcessLookupError:
+        return True
+    except (OSError, ValueError):
+        pass
+    return False
 
-# Window state file
-WINDOW_STATE_FILE = "window_state.json"
+class JobLost(Exception):
+    """Another process has taken over a job this runner was executing"""
 
-def load_window_state():
-    """Load window size and position from file"""
-    try:
-        if os.path.exists(WINDOW_STATE_FILE):
-            with open(WINDOW_STATE_FILE, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        safe_print(f"Error loading window state: {e}")
-    return None
+class JobRunner:
+    """Runs jobs from the jobs table on a small pool of background threads.
 
-if __name__ == '__main__':
-    # Import pending Telegram tasks on startup
-    safe_print("📥 Checking for pending Telegram tasks...")
-    imported_count = import_telegram_tasks_to_db()
+    Every step is one db_writer command that commits together with the job's
+    progress, so a job cut short by an exit carries on from there at the next
+    start. After each step the runner waits as long as the step took, which
+    keeps requests and the Telegram import moving during a big delete.
+
+    Several processes may share the database (say, the desktop app next to
+    a headless server), so a runner claims a job before running it and
+    refreshes its heartbeat with every step. Every JOB_POLL_SECONDS it takes
+    over jobs whose owner has exited or gone quiet for JOB_STALE_SECONDS.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        # "<pid>-<random>": the pid tells other processes when the owner has exited
+        self.owner = f'{os.getpid()}-{os.urandom(4).hex()}'
+        self._queue = queue.Queue()
+        self._active = set()    # ids queued or running here
+        self._lock = threading.Lock()
+        self._threads = []
+        self._poller = None
+
+    def start(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'jobs-{len(self._threads) + 1}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, job_id, previous_owner=None):
+        """Queue a job; previous_owner is the exited owner it is being taken over from"""
+        with self._lock:
+            if job_id in self._active:
+                return False
+            self._active.add(job_id)
+        self.start()
+        self._queue.put((job_id, previous_owner))
+        return True
+
+    def resume(self):
+        """Queue the jobs an earlier run left unfinished, then keep looking for orphaned ones"""
+        resumed = self.poll()
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name='jobs-poll', daemon=True)
+                self._poller.start()
+        return resumed
+
+    def poll(self):
+        """Queue unfinished jobs that no live process is running; returns how many"""
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, owner, COALESCE(heartbeat, 0) FROM jobs
+                WHERE state IN ('queued', 'running')
+                ORDER BY id
+            ''')
+            rows = cursor.fetchall()
+
+        stale = time.time() - JOB_STALE_SECONDS
+        queued = 0
+        for job_id, owner, heartbeat in rows:
+            if owner is None or owner == self.owner or heartbeat < stale:
+                queued += self.enqueue(job_id)
+            elif _owner_exited(owner):
+                queued += self.enqueue(job_id, owner)
+        return queued
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(JOB_POLL_SECONDS)
+            try:
+                self.poll()
+            except Exception as e:
+                safe_print(f"⚠️ Could not check for orphaned jobs: {e}")
+
+    def cancel(self, job_id):
+        """Ask for a queued or running job to stop before its next step; False if it already ended"""
+        return db_writer.run(lambda cursor: cursor.execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state IN ('queued', 'running')", (job_id,)
+        ).rowcount == 1)
+
+    def _run(self):
+        while True:
+            job_id, previous_owner = self._queue.get()
+            try:
+                self._execute(job_id, previous_owner)
+            except Exception as e:
+                safe_print(f"⚠️ Job {job_id} failed: {e}")
+            finally:
+                with self._lock:
+                    self._active.discard(job_id)
+
+    def _execute(self, job_id, previous_owner=None):
+        # Claim first, so the progress read below is the one this runner continues from
+        if not db_writer.run(self._claim, job_id, previous_owner):
+            return
+
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT kind, params, done, position, result, cancel_requested FROM jobs WHERE id = ?', (job_id,)
+            )
+            kind, params, done, position, result, cancel_requested = cursor.fetchone()
+            step, cancel = JOB_KINDS[kind]
+            job = {
+                'id': job_id,
+                'params': json.loads(params),
+                'done': done,
+                'position': json.loads(position) if position else {},
+                'result': json.loads(result) if result else None,
+                'cancel_requested': bool(cancel_requested)
+            }
+
+            try:
+                while not job['cancel_requested']:
+                    began = time.perf_counter()
+                    if kind in READ_ONLY_JOB_KINDS:
+                        progress, events = step(cursor, job)
+                        db_writer.run(self._save_progress, job, progress)
+                    else:
+                        progress, events = db_writer.run(self._step, step, job)
+                    self._publish(events)
+                    if not progress:
+                        return
+                    time.sleep(max(JOB_MIN_PAUSE_SECONDS, time.perf_counter() - began))
+
+                self._finish(job, 'cancelled', None, cancel)
+            except JobLost:
+                safe_print(f"⚠️ Job {job_id} ({kind}) was taken over by another process")
+            except Exception as e:
+                self._finish(job, 'failed', str(e), cancel)
+                safe_print(f"⚠️ Job {job_id} ({kind}) failed after {job['done']} unit(s): {e}")
+
+    def _claim(self, cursor, job_id, previous_owner=None):
+        """Make this runner the job's owner, unless another live one already is"""
+        cursor.execute('''
+            UPDATE jobs
+            SET state = 'running', owner = ?, heartbeat = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND state IN ('queued', 'running')
+              AND (owner IS NULL OR owner IN (?, ?) OR COALESCE(heartbeat, 0) < ?)
+        ''', (self.owner, time.time(), job_id, self.owner, previous_owner, time.time() - JOB_STALE_SECONDS))
+        return cursor.rowcount == 1
+
+    def _step(self, cursor, step, job):
+        progress, events = step(cursor, job)
+        self._save_progress(cursor, job, progress)
+        return progress, events
+
+    def _save_progress(self, cursor, job, progress):
+        job['done'] += progress
+        cursor.execute('''
+            UPDATE jobs
+            SET done = ?, position = ?, result = ?, state = ?, heartbeat = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND owner = ?
+        ''', (
+            job['done'], json.dumps(job['position']), json.dumps(job['result']),
+            'running' if progress else 'done', time.time(), job['id'], self.owner
+        ))
+        if cursor.rowcount == 0:
+            # Raising rolls the step back along with it
+            raise JobLost(job['id'])
+        # PUT /api/jobs/<id>/cancel may have come through any process
+        cursor.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job['id'],))
+        job['cancel_requested'] = bool(cursor.fetchone()[0])
+
+    def _finish(self, job, state, error, cancel):
+        """Stop a job early, undoing its up-front effects (e.g. unhide a folder)"""
+        def write(cursor):
+            events = cancel(cursor, job) if cancel else []
+            cursor.execute(
+                'UPDATE jobs SET state = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (state, error, job['id'])
+            )
+            return events
+
+        self._publish(db_writer.run(write))
+
+    def _publish(self, events):
+        response_cache.invalidate()
+        for entity, action, items in events:
+            notify_change(entity, action, items)
+
+job_runner = JobRunner()
+
+def serialize_job(row):
+    job_id, kind, state, total, done, error, result, created_at, updated_at = row
+    return {
+        'id': job_id,
+        'kind': kind,
+        'state': state,
+        'total': total,
+        'done': done,
+        'progress': min(done / total, 1.0) if total else (1.0 if state == 'done' else 0.0),
+        'error': error,
+        'result': json.loads(result) if result else None,
+        'created_at': created_at,
+        'updated_at': updated_at
+    }
+
+JOB_COLUMNS = 'id, kind, state, total, done, error, result, created_at, updated_at'
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Recent background jobs, newest first"""
+    cursor = get_db().cursor()
+    cursor.execute(f'SELECT {JOB_COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?', (JOB_HISTORY,))
+    return jsonify([serialize_job(row) for row in cursor.fetchall()])
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    cursor = get_db().cursor()
+    cursor.execute(f'SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    if not row:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(serialize_job(row))
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['PUT'])
+def cancel_job(job_id):
+    cursor = get_db().cursor()
+    cursor.execute('SELECT state FROM jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    if not row:
+        return jsonify({'error': 'Job not found'}), 404
+    if row[0] not in ('queued', 'running') or not job_runner.cancel(job_id):
+        cursor.execute('SELECT state FROM jobs WHERE id = ?', (job_id,))
+        return jsonify({'error': f'Job is already {cursor.fetchone()[0]}'}), 409
+
+    return jsonify({'message': 'Job will stop after its current step'}), 202
+
+# ============= EXPORT / IMPORT =============
+
+# Finished exports and uploaded import files
+EXPORT_DIR = os.environ.get('TASKMASTER_EXPORT_DIR', 'exports')
+IMPORT_DIR = os.environ.get('TASKMASTER_IMPORT_DIR', 'imports')
+EXPORT_KEEP = 10
+# Rows read per export step, records written per import transaction
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = JOB_CHUNK_SIZE
+UPLOAD_BUFFER_SIZE = 64 * 1024
+# Bad records described in an import's result (the rest are only counted)
+IMPORT_ERROR_LIMIT = 20
+
+TRANSFER_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# Export order: folders come before the todos that name them
+TRANSFER_ENTITIES = ['folders', 'todos', 'notes']
+TRANSFER_TYPES = {'folders': 'folder', 'todos': 'todo', 'notes': 'note'}
+
+# Columns of each entity, in file order. Todos carry their folder's name rather
+# than its id, so a file can be imported into a different database.
+TRANSFER_FIELDS = {
+    'folders': ['id', 'name', 'color', 'created_at'],
+    'todos': [
+        'id', 'title', 'description', 'completed', 'priority', 'category', 'folder',
+        'kanban_status', 'added_to_today', 'today_date', 'archived', 'created_at', 'updated_at'
+    ],
+    'notes': ['id', 'content', 'created_at', 'updated_at']
+}
+TRANSFER_FLAGS = {'completed', 'added_to_today', 'archived'}
+
+# One keyset page per export step (params: last id, page size)
+EXPORT_QUERIES = {
+    'folders': 'SELECT id, name, color, created_at FROM folders WHERE deleting = 0 AND id > ? ORDER BY id LIMIT ?',
+    'todos': '''
+        SELECT t.id, t.title, t.description, t.completed, t.priority, t.category, f.name,
+               t.kanban_status, t.added_to_today, t.today_date, t.archived, t.created_at, t.updated_at
+        FROM all_todos t
+        LEFT JOIN folders f ON f.id = t.folder_id
+        WHERE t.id > ? AND COALESCE(f.deleting, 0) = 0
+        ORDER BY t.id
+        LIMIT ?
+    ''',
+    'notes': 'SELECT id, content, created_at, updated_at FROM notes WHERE id > ? ORDER BY id LIMIT ?'
+}
+
+def export_path(job_id, file_format):
+    return os.path.join(EXPORT_DIR, f'export-{job_id}.{file_format}')
+
+def _trim_exports():
+    """Keep only the newest EXPORT_KEEP export files"""
+    names = sorted(
+        (name for name in os.listdir(EXPORT_DIR) if name.startswith('export-')),
+        key=lambda name: os.path.getmtime(os.path.join(EXPORT_DIR, name))
+    )
+    for name in names[:-EXPORT_KEEP]:
+        os.remove(os.path.join(EXPORT_DIR, name))
+
+def _encode_records(entity, rows, file_format, header):
+    """Rows of one entity as NDJSON lines or CSV records (with the header row first if asked)"""
+    fields = TRANSFER_FIELDS[entity]
+    buffer = io.StringIO()
+    if file_format == 'csv':
+        writer = csv.writer(buffer, lineterminator='\n')
+        if header:
+            writer.writerow(fields)
+        for row in rows:
+            writer.writerow([
+                int(bool(value)) if name in TRANSFER_FLAGS else ('' if value is None else value)
+                for name, value in zip(fields, row)
+            ])
+    else:
+        for row in rows:
+            record = {'type': TRANSFER_TYPES[entity]}
+            for name, value in zip(fields, row):
+                record[name] = bool(value) if name in TRANSFER_FLAGS else value
+            buffer.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+    return buffer.getvalue().encode('utf-8')
+
+def _export_step(cursor, job):
+    """Append the next page of rows to the export file"""
+    params, position = job['params'], job['position']
+    file_format, entities = params['format'], params['entities']
+    path = export_path(job['id'], file_format)
+    index = position.get('entity', 0)
+    last_id = position.get('last_id', 0)
+    written = position.get('bytes', 0)
+
+    rows = []
+    while index < len(entities):
+        cursor.execute(EXPORT_QUERIES[entities[index]], (last_id, EXPORT_CHUNK_SIZE))
+        rows = cursor.fetchall()
+        if rows:
+            break
+        index, last_id = index + 1, 0
+
+    # CSV files always get their header, even when there is nothing to export
+    data = b''
+    if rows or written == 0:
+        entity = entities[min(index, len(entities) - 1)]
+        data = _encode_records(entity, rows, file_format, header=file_format == 'csv' and written == 0)
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        # Anything past the recorded size comes from a step that never committed
+        f.seek(written)
+        f.truncate()
+        f.write(data)
+
+    position.update({'entity': index, 'last_id': rows[-1][0] if rows else 0, 'bytes': written + len(data)})
+    if not rows:
+        job['result'] = {'file': os.path.basename(path), 'bytes': position['bytes'], 'rows': job['done']}
+        _trim_exports()
+    return len(rows), []
+
+def _export_cancel(cursor, job):
+    """Drop the partial file"""
+    path = export_path(job['id'], job['params']['format'])
+    if os.path.exists(path):
+        os.remove(path)
+    return []
+
+def _parse_flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+def _blank_to_none(value):
+    return None if value == '' else value
+
+def _read_import_batch(f, file_format, position):
+    """The next IMPORT_BATCH_SIZE records from f (positioned at the saved offset), as dicts"""
+    lines = (line.decode('utf-8-sig') for line in iter(f.readline, b''))
+    if file_format == 'csv':
+        reader = csv.reader(lines)
+        if 'header' not in position:
+            position['header'] = [name.strip() for name in next(reader, [])]
+        header = position['header']
+        # islice stops pulling lines at the last record, so f.tell() is exact afterwards
+        return [
+            {name: _blank_to_none(value) for name, value in zip(header, values)}
+            for values in itertools.islice(reader, IMPORT_BATCH_SIZE)
+            if any(values)
+        ]
+
+    records = []
+    for line in itertools.islice(lines, IMPORT_BATCH_SIZE):
+        if line.strip():
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                records.append(ValueError(f'invalid JSON: {e}'))
+    return records
+
+def _import_step(cursor, job):
+    """Insert the next batch of records (one transaction, executemany per table)"""
+    params, position = job['params'], job['position']
+    result = job['result'] or {'imported': {entity: 0 for entity in TRANSFER_ENTITIES}, 'folders_created': 0, 'skipped': 0, 'errors': []}
+    job['result'] = result
+    offset = position.get('offset', 0)
+
+    with open(params['path'], 'rb') as f:
+        f.seek(offset)
+        records = _read_import_batch(f, params['format'], position)
+        new_offset = f.tell()
+
+    if new_offset == offset:
+        os.remove(params['path'])
+        imported = sum(result['imported'].values())
+        return 0, [('all', 'resync', [{'job_id': job['id']}])] if imported else []
+
+    folder_ids = {}
+
+    def resolve_folder(name, color=None):
+        """Id of the folder called name, created if there is none"""
+        if name in folder_ids:
+            return folder_ids[name]
+        cursor.execute('SELECT id FROM folders WHERE name = ? AND deleting = 0 ORDER BY id LIMIT 1', (name,))
+        row = cursor.fetchone()
+        if row:
+            folder_ids[name] = row[0]
+        else:
+            cursor.execute('INSERT INTO folders (name, color) VALUES (?, ?)', (name, color or '#667eea'))
+            folder_ids[name] = cursor.lastrowid
+            result['folders_created'] += 1
+        return folder_ids[name]
+
+    todos, notes = [], []
+    for number, record in enumerate(records, start=position.get('records', 0) + 1):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            if not isinstance(record, dict):
+                raise ValueError('not an object')
+            entity = params['entity'] if params['format'] == 'csv' else {
+                value: key for key, value in TRANSFER_TYPES.items()
+            }.get(record.get('type'))
+
+            if entity == 'folders':
+                if not record.get('name'):
+                    raise ValueError('folder name is required')
+                resolve_folder(record['name'], record.get('color'))
+                result['imported']['folders'] += 1
+            elif entity == 'todos':
+                if not record.get('title'):
+                    raise ValueError('title is required')
+                todos.append((
+                    record['title'],
+                    record.get('description') or '',
+                    _parse_flag(record.get('completed')),
+                    record.get('priority') or 'medium',
+                    record.get('category') or 'general',
+                    resolve_folder(record['folder']) if record.get('folder') else None,
+                    record.get('kanban_status') or 'todo',
+                    _parse_flag(record.get('added_to_today')),
+                    record.get('today_date'),
+                    _parse_flag(record.get('archived')),
+                    record.get('created_at'),
+                    record.get('updated_at')
+                ))
+            elif entity == 'notes':
+                if not record.get('content'):
+                    raise ValueError('content is required')
+                notes.append((record['content'], record.get('created_at'), record.get('updated_at')))
+            else:
+                raise ValueError(f"unknown type {record.get('type')!r}")
+        except ValueError as e:
+            result['skipped'] += 1
+            if len(result['errors']) < IMPORT_ERROR_LIMIT:
+                result['errors'].append(f'record {number}: {e}')
+
+    cursor.executemany('''
+        INSERT INTO todos (title, description, completed, priority, category, folder_id, kanban_status,
+                           added_to_today, today_date, archived, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+    ''', todos)
+    move_archived_todos(cursor)
+    cursor.executemany('''
+        INSERT INTO notes (content, created_at, updated_at)
+        VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+    ''', notes)
+    result['imported']['todos'] += len(todos)
+    result['imported']['notes'] += len(notes)
+
+    position['offset'] = new_offset
+    position['records'] = position.get('records', 0) + len(records)
+    return new_offset - offset, []
+
+def _import_cancel(cursor, job):
+    """Drop the upload; records already imported stay"""
+    if os.path.exists(job['params']['path']):
+        os.remove(job['params']['path'])
+    return [('all', 'resync', [{'job_id': job['id']}])]
+
+JOB_KINDS['export'] = (_export_step, _export_cancel)
+JOB_KINDS['import'] = (_import_step, _import_cancel)
+
+@app.route('/api/export', methods=['POST'])
+def export_data():
+    """Start an export job: {"format": "ndjson" | "csv", "entities": [...]}.
+
+    NDJSON files hold any mix of folders, todos and notes (one object per
+    line, tagged with "type"); a CSV file holds a single entity.
+    """
+    data = request.get_json(silent=True) or {}
+    file_format = data.get('format', 'ndjson')
+    if file_format not in TRANSFER_FORMATS:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    entities = data.get('entities') or (['todos'] if file_format == 'csv' else TRANSFER_ENTITIES)
+    if not isinstance(entities, list) or any(entity not in TRANSFER_ENTITIES for entity in entities):
+        return jsonify({'error': f"entities must be a list of {', '.join(TRANSFER_ENTITIES)}"}), 400
+    if file_format == 'csv' and len(entities) != 1:
+        return jsonify({'error': 'A CSV export holds exactly one entity'}), 400
+    entities = [entity for entity in TRANSFER_ENTITIES if entity in entities]
+
+    cursor = get_db().cursor()
+    totals = {
+        'folders': 'SELECT COUNT(*) FROM folders WHERE deleting = 0',
+        'todos': "SELECT count FROM todo_stats WHERE dimension = 'status' AND key = 'total'",
+        'notes': 'SELECT COUNT(*) FROM notes'
+    }
+    total = 0
+    for entity in entities:
+        cursor.execute(totals[entity])
+        row = cursor.fetchone()
+        total += row[0] if row else 0
+
+    job_id = db_writer.run(create_job, 'export', {'format': file_format, 'entities': entities}, total)
+    job_runner.enqueue(job_id)
+    return job_accepted(job_id, 'Export started')
+
+@app.route('/api/import', methods=['POST'])
+def import_data():
+    """Start an import job from an uploaded file (?format=ndjson|csv, ?entity= for CSV).
+
+    The file comes as the multipart field "file" or as the raw request body.
+    Folders are matched by name and created when missing; ids in the file are ignored.
+    """
+    file_format = request.args.get('format', 'ndjson')
+    entity = request.args.get('entity', 'todos')
+    if file_format not in TRANSFER_FORMATS:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    if entity not in TRANSFER_ENTITIES:
+        return jsonify({'error': f"entity must be one of {', '.join(TRANSFER_ENTITIES)}"}), 400
+
+    # Copy the upload to disk in chunks rather than holding it in memory
+    upload = request.files.get('file')
+    source = upload.stream if upload is not None else request.stream
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    path = os.path.join(IMPORT_DIR, f'import-{os.urandom(8).hex()}.{file_format}')
+    with open(path, 'wb') as f:
+        while chunk := source.read(UPLOAD_BUFFER_SIZE):
+            f.write(chunk)
+
+    size = os.path.getsize(path)
+    if size == 0:
+        os.remove(path)
+        return jsonify({'error': 'The uploaded file is empty'}), 400
+
+    job_id = db_writer.run(create_job, 'import', {'format': file_format, 'entity': entity, 'path': path}, size)
+    job_runner.enqueue(job_id)
+    return job_accepted(job_id, 'Import started')
+
+@app.route('/api/jobs/<int:job_id>/download', methods=['GET'])
+def download_export(job_id):
+    cursor = get_db().cursor()
+    cursor.execute("SELECT state, params FROM jobs WHERE id = ? AND kind = 'export'", (job_id,))
+    row = cursor.fetchone()
+    if not row:
+        return jsonify({'error': 'Export not found'}), 404
+    if row[0] != 'done':
+        return jsonify({'error': f'Export is {row[0]}'}), 409
+
+    file_format = json.loads(row[1])['format']
+    path = export_path(job_id, file_format)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Export file has been removed'}), 410
+    return send_file(os.path.abspath(path), mimetype=TRANSFER_FORMATS[file_format], as_attachment=True,
+                     download_name=f'taskmaster-export-{job_id}.{file_format}')
+
+# ============= QUERY PLAN CHECK =============
+
+def hot_queries():
+    """(name, sql, params) for the queries the UI runs all the time"""
+    page = 100
+    all_fields = TODO_FIELDS
+    queries = [
+        ('todos', *build_todo_list_query(all_fields, ["t.archived = 0"], [], TODOS_ORDER)),
+        ('todos page', *build_todo_list_query(all_fields, ["t.archived = 0"], [], TODOS_ORDER, page)),
+        ('todos next page', *build_todo_list_query(all_fields, ["t.archived = 0"], [], TODOS_ORDER, page, ['2000-01-01 00:00:00', 1])),
+        ('todos pending', *build_todo_list_query(all_fields, ["t.completed = 0", "t.archived = 0"], [], TODOS_ORDER, page)),
+        ('todos folder', *build_todo_list_query(all_fields, ["t.folder_id = ?", "t.archived = 0"], [1], TODOS_ORDER, page)),
+        ('todos category', *build_todo_list_query(all_fields, ["t.category = ?", "t.archived = 0"], ['general'], TODOS_ORDER, page)),
+        ('todos with archived', *build_todo_list_query(all_fields, [], [], TODOS_ORDER, page, source='all_todos')),
+        ('today', *build_todo_list_query(all_fields, ["t.added_to_today = 1", "t.archived = 0"], [], TODAY_ORDER)),
+        ('today with completed', *build_todo_list_query(all_fields, ["t.added_to_today = 1"], [], TODAY_ORDER, source='all_todos')),
+        ('archived', *build_todo_list_query(all_fields, [], [], ARCHIVED_ORDER, page, source='todos_archive')),
+        ('archived next page', *build_todo_list_query(all_fields, [], [], ARCHIVED_ORDER, page, ['2000-01-01 00:00:00', 1], source='todos_archive')),
+        ('todo by id', 'SELECT 1 FROM all_todos WHERE id = ?', [1]),
+        ('archive moves', f'SELECT {TODO_COLUMNS} FROM todos WHERE archived = 1', []),
+        ('unarchive moves', f'SELECT {TODO_COLUMNS} FROM todos_archive WHERE archived = 0', []),
+        ('folder todos delete', 'DELETE FROM todos WHERE folder_id = ?', [1]),
+        ('folder archive delete', 'DELETE FROM todos_archive WHERE folder_id = ?', [1])
+    ]
+    if FTS_ENABLED:
+        queries.append(('todos search', *build_todo_list_query(
+            all_fields,
+            ["t.id IN (SELECT rowid FROM todos_fts WHERE todos_fts MATCH ?)", "t.archived = 0"],
+            ['"task"*'], TODOS_ORDER, page
+        )))
+    return queries
+
+def check_query_plans(conn):
+    """Return (name, plan step) for every hot query that scans a todo table without an index"""
+    problems = []
+    cursor = conn.cursor()
+    for name, query, params in hot_queries():
+        cursor.execute(f'EXPLAIN QUERY PLAN {query}', params)
+        for step in cursor.fetchall():
+            detail = step[3]
+            if detail.startswith(('SCAN t', 'SCAN todos')) and 'INDEX' not in detail:
+                problems.append((name, detail))
+    return problems
+
+# ============= MAINTENANCE =============
+
+# Seconds between maintenance runs (0 switches the scheduler off)
+MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get('TASKMASTER_MAINTENANCE_INTERVAL', '600'))
+# A run only starts once no request has come in for this long
+MAINTENANCE_IDLE_SECONDS = 30
+# Time a scheduled run may spend on the database
+MAINTENANCE_BUDGET_SECONDS = 1.0
+# Free pages released per incremental_vacuum step; each step is its own short write
+VACUUM_STEP_PAGES = 512
+# Rows ANALYZE samples per index, so refreshing statistics stays quick on big tables
+ANALYSIS_LIMIT = 1000
+MAINTENANCE_HISTORY = 20
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def database_usage(conn):
+    """File sizes and free-page numbers for a maintenance report"""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    return {
+        'file_bytes': _file_size(DATABASE_PATH),
+        'wal_bytes': _file_size(DATABASE_PATH + '-wal'),
+        'page_size': page_size,
+        'page_count': page_count,
+        'free_pages': free_pages,
+        # Share of the file that is free-list pages scattered between live data
+        'fragmentation': round(free_pages / page_count, 4) if page_count else 0.0
+    }
+
+def _convert_to_incremental_vacuum(cursor):
+    """Switch an older database to auto_vacuum=INCREMENTAL; only a full VACUUM changes the mode"""
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    cursor.execute('VACUUM')
+
+def _incremental_vacuum(cursor, pages):
+    # Each row the pragma returns is one freed page; fetchall runs it to completion
+    cursor.execute(f'PRAGMA incremental_vacuum({pages})').fetchall()
+
+def _refresh_statistics(cursor):
+    # PRAGMA optimize only revisits tables that already have statistics, so a
+    # never-analyzed database gets one sampled ANALYZE instead
+    cursor.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    analyzed = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+    ).fetchone()
+    cursor.execute('PRAGMA optimize' if analyzed else 'ANALYZE')
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+class MaintenanceScheduler:
+    """Reclaims free pages, refreshes planner statistics and checkpoints the WAL while the app is idle.
+
+    Every step is bounded: vacuuming goes VACUUM_STEP_PAGES at a time, and a
+    scheduled run stops once its budget is spent or a request comes in. The
+    one exception is the full VACUUM that switches a database created before
+    auto_vacuum=INCREMENTAL over to it, which happens once. Writes go through
+    db_writer like every other write.
+    """
+
+    def __init__(self, interval=MAINTENANCE_INTERVAL_SECONDS, idle=MAINTENANCE_IDLE_SECONDS,
+                 budget=MAINTENANCE_BUDGET_SECONDS):
+        self.interval = interval
+        self.idle = idle
+        self.budget = budget
+        self.last_activity = time.monotonic()
+        self.reports = deque(maxlen=MAINTENANCE_HISTORY)
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='db-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval):
+            # Wait for a quiet spell before touching the database
+            while (quiet := time.monotonic() - self.last_activity) < self.idle:
+                if self._stopped.wait(self.idle - quiet):
+                    return
+            try:
+                self.run(self.budget)
+            except sqlite3.Error as e:
+                safe_print(f"⚠️ Database maintenance failed: {e}")
+
+    def run(self, budget=None, yield_to_requests=True):
+        """One maintenance pass, in at most budget seconds if given; returns its report"""
+        with self._run_lock, db_pool.connection() as conn:
+            started = time.monotonic()
+
+            def out_of_time():
+                if yield_to_requests and self.last_activity > started:
+                    return True
+                return budget is not None and time.monotonic() - started >= budget
+
+            report = {
+                'started_at': datetime.now().isoformat(timespec='seconds'),
+                'before': database_usage(conn),
+                'converted': False,
+                'vacuumed_pages': 0,
+                'optimized': False,
+                'checkpoint': None,
+                'complete': False
+            }
+
+            # 1. Hand free pages back to the filesystem (needs auto_vacuum = INCREMENTAL)
+            incremental = conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+            if not incremental and not out_of_time():
+                # Compacts the file as a side effect, so there is nothing left to reclaim
+                db_writer.run_exclusive(_convert_to_incremental_vacuum)
+                report['converted'] = True
+            elif incremental:
+                free_pages = report['before']['free_pages']
+                while free_pages and not out_of_time():
+                    db_writer.run(_incremental_vacuum, VACUUM_STEP_PAGES)
+                    remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                    report['vacuumed_pages'] += free_pages - remaining
+                    free_pages = remaining
+
+            # 2. Refresh planner statistics
+            if not out_of_time():
+                db_writer.run(_refresh_statistics)
+                report['optimized'] = True
+
+            # 3. Copy committed WAL frames into the database without blocking readers or writers
+            if not out_of_time():
+                busy, wal_frames, checkpointed = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+                if wal_frames >= 0:
+                    report['checkpoint'] = {'wal_frames': wal_frames, 'checkpointed_frames': checkpointed}
+                report['complete'] = True
+
+            report['after'] = database_usage(conn)
+            report['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+
+        self.reports.append(report)
+        before, after = report['before'], report['after']
+        if not report['vacuumed_pages'] and not report['converted'] and report['complete']:
+            return report
+        safe_print(
+            f"🧹 Database maintenance: {_megabytes(before['file_bytes'])} → {_megabytes(after['file_bytes'])}, "
+            f"WAL {_megabytes(before['wal_bytes'])} → {_megabytes(after['wal_bytes'])}, "
+            f"free pages {before['fragmentation']:.1%} → {after['fragmentation']:.1%} "
+            f"({report['duration_ms']:.0f} ms{'' if report['complete'] else ', stopped early'})"
+        )
+        return report
+
+maintenance = MaintenanceScheduler()
+
+@app.before_request
+def note_request_activity():
+    # Metrics scrapes and asset fetches don't make the database busy
+    if request.endpoint not in DB_FREE_ENDPOINTS:
+        maintenance.touch()
+
+@app.route('/api/debug/maintenance', methods=['GET'])
+def maintenance_reports():
+    """Reports of the recent maintenance runs, newest first"""
+    return jsonify(list(reversed(maintenance.reports)))
+
+# ============= STARTUP =============
+
+class StartupTimer:
+    """Records how long each startup phase took, and on which thread"""
+
+    def __init__(self, started):
+        self.started = started
+        self.phases = []
+        self._lock = threading.Lock()
+
+    def record(self, name, began, ended):
+        with self._lock:
+            self.phases.append((began - self.started, ended - began, name, threading.current_thread().name))
+
+    @contextmanager
+    def phase(self, name):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, began, time.perf_counter())
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.record(name, now, now)
+
+    def report(self):
+        safe_print(f"{'start':>9} {'took':>9}  phase")
+        for offset, duration, name, thread_name in sorted(self.phases):
+            safe_print(f"{offset * 1000:7.1f}ms {duration * 1000:7.1f}ms  {name} [{thread_name}]")
+
+startup_timer = StartupTimer(STARTUP_STARTED)
+
+def prepare_database():
+    """Run migrations, then import Telegram tasks that arrived while the app was closed"""
+    with startup_timer.phase('database migrations'):
+        ensure_db()
+
+    with startup_timer.phase('telegram import'), request_profiler.capture('telegram-import'):
+        imported_count = import_telegram_tasks_to_db()
     if imported_count > 0:
         safe_print(f"✅ Imported {imported_count} task(s) from Telegram!")
     else:
         safe_print("📭 No pending Telegram tasks.")
 
-    # Start Flask server
-    flask_thread = threading.Thread(target=start_flask)
-    flask_thread.daemon = True
-    flask_thread.start()
+    resumed = job_runner.resume()
+    if resumed:
+        safe_print(f"🔁 Resuming {resumed} unfinished background job(s)")
+
+    maintenance.start()
+
+# Headless server defaults
+HEADLESS_THREADS = 16
+HEADLESS_KEEP_ALIVE_SECONDS = 30
+
+def serve_headless(host, port, threads, keep_alive, streams=EVENT_STREAM_LIMIT):
+    """Serve the app without a window until interrupted.
+
+    Uses waitress when it is installed (pip install waitress), otherwise
+    werkzeug's threaded server. Several processes may share the database
+    file: WAL lets readers run alongside a writer, and the busy timeout
+    makes writers wait for each other instead of failing.
+
+    Every open /api/events stream occupies a waitress thread, so the pool
+    gets streams threads on top of threads; clients past that limit are
+    turned away with a 503 and retry later. werkzeug has no such settings,
+    so the fallback refuses to start with anything but the defaults.
+    """
+    # One pooled connection per server thread
+    db_pool.size = max(db_pool.size, threads + streams)
+    change_feed.limit = streams
+
+    try:
+        import waitress
+    except ImportError:
+        waitress = None
+
+    if waitress is None and (threads, keep_alive, streams) != (HEADLESS_THREADS, HEADLESS_KEEP_ALIVE_SECONDS, EVENT_STREAM_LIMIT):
+        safe_print("❌ --threads, --keep-alive and --max-streams need waitress (pip install waitress)")
+        sys.exit(2)
+
+    safe_print(f"🌐 TaskMaster serving on http://{host}:{port}")
+    if waitress is not None:
+        waitress.serve(app, host=host, port=port, threads=threads + streams, channel_timeout=keep_alive, ident='TaskMaster')
+        return
+
+    safe_print("⚠️ waitress not installed, using werkzeug's threaded server (pip install waitress)")
+    # Threads are created per request and connections kept alive (HTTP/1.1)
+    make_server(host, port, app, threaded=True).serve_forever()
+
+def prepare_assets():
+    with startup_timer.phase('build assets'):
+        get_assets()
+
+# Set once the server socket is bound (or binding failed)
+server_ready = threading.Event()
+flask_server = None
+
+def start_flask():
+    global flask_server
+    try:
+        with startup_timer.phase('bind server'):
+            flask_server = make_server('127.0.0.1', 5000, app, threaded=True)
+    except OSError as e:
+        safe_print(f"❌ Could not start server: {e}")
+        return
+    finally:
+        server_ready.set()
+    flask_server.serve_forever()
+
+# ============= SETTINGS =============
+
+# Window state file
+WINDOW_STATE_FILE = "window_state.json"
+# Changes are written this long after the last one (moving a window fires many events)
+SETTINGS_FLUSH_DELAY_SECONDS = 1.0
+
+class SettingsStore:
+    """UI settings kept in memory and written to a JSON file.
+
+    update() only counts values that actually changed. Changes are
+    written on a debounce timer and by flush() at shutdown, through a
+    temp file and os.replace so a crash never leaves a half-written file.
+    """
+
+    def __init__(self, path, delay=SETTINGS_FLUSH_DELAY_SECONDS):
+        self.path = path
+        self.delay = delay
+        self._values = {}
+        self._dirty = False
+        self._timer = None
+        self._lock = threading.Lock()
 
-    # Wait for Flask to be ready (reduced wait time)
-    import time
-    import socket
-    for _ in range(20):  # Wait up to 2 seconds total
         try:
-            socket.create_connection(("127.0.0.1", 5000), timeout=0.1)
-            break
-        except:
-            time.sleep(0.1)
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    self._values = json.load(f)
+        except Exception as e:
+            safe_print(f"Error loading settings from {path}: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def update(self, values):
+        """Merge in new values; returns True if anything changed"""
+        with self._lock:
+            changed = {k: v for k, v in values.items() if self._values.get(k) != v}
+            if not changed:
+                return False
+            self._values.update(changed)
+            self._dirty = True
+
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+            return True
+
+    def flush(self):
+        """Write pending changes to disk now"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+
+            temp_path = self.path + '.tmp'
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump(self._values, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+                self._dirty = False
+            except Exception as e:
+                safe_print(f"Error saving settings to {self.path}: {e}")
+
+window_settings = SettingsStore(WINDOW_STATE_FILE)
+
+def clamp_window_state(data):
+    """Keep saved window geometry within sane bounds"""
+    state = {}
+    if 'width' in data:
+        state['width'] = min(max(int(data['width']), 800), 3840)
+    if 'height' in data:
+        state['height'] = min(max(int(data['height']), 600), 2160)
+    if 'x' in data:
+        state['x'] = max(0, int(data['x']))
+    if 'y' in data:
+        state['y'] = max(0, int(data['y']))
+    return state
+
+def track_window_state(window):
+    """Record the window's size and position as pywebview reports changes"""
+    def on_resized(width, height):
+        window_settings.update(clamp_window_state({'width': width, 'height': height}))
+
+    def on_moved(x, y):
+        window_settings.update(clamp_window_state({'x': x, 'y': y}))
+
+    window.events.resized += on_resized
+    window.events.moved += on_moved
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TaskMaster')
+    parser.add_argument('--check-query-plans', action='store_true',
+                        help='Fail if a hot query scans the whole todos table, then exit')
+    parser.add_argument('--maintenance', action='store_true',
+                        help='Reclaim free space, refresh statistics and checkpoint the WAL now, then exit')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Print how long each startup phase takes, then exit before opening the window')
+    parser.add_argument('--headless', action='store_true',
+                        help='Run only the web server, without a window')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind in headless mode')
+    parser.add_argument('--port', type=int, default=5000, help='Port to bind in headless mode')
+    parser.add_argument('--threads', type=int, default=HEADLESS_THREADS,
+                        help='Worker threads in headless mode (needs waitress)')
+    parser.add_argument('--keep-alive', type=int, default=HEADLESS_KEEP_ALIVE_SECONDS,
+                        help='Seconds an idle connection stays open in headless mode (needs waitress)')
+    parser.add_argument('--max-streams', type=int, default=EVENT_STREAM_LIMIT,
+                        help='Live-update streams (open windows) served at once in headless mode; '
+                             'each gets its own thread on top of --threads')
+    args = parser.parse_args()
+    startup_timer.record('module import', STARTUP_STARTED, time.perf_counter())
+
+    if args.check_query_plans:
+        ensure_db()
+        with db_pool.connection() as conn:
+            problems = check_query_plans(conn)
+        for name, detail in problems:
+            safe_print(f"❌ {name}: {detail}")
+        if not problems:
+            safe_print("✅ No hot query scans the todos table")
+        sys.exit(1 if problems else 0)
+
+    if args.maintenance:
+        ensure_db()
+        report = maintenance.run(yield_to_requests=False)
+        safe_print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    if args.headless:
+        prepare_database()
+        if TELEGRAM_ENABLED:
+            bot_thread = threading.Thread(target=run_telegram_bot, name='telegram-bot', daemon=True)
+            bot_thread.start()
+        threading.Thread(target=prepare_assets, name='startup-assets', daemon=True).start()
+        try:
+            serve_headless(args.host, args.port, args.threads, args.keep_alive, args.max_streams)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            telegram_ingestor.stop()
+        sys.exit(0)
+
+    # Migrations + Telegram import, the server and the bot all start at once
+    db_thread = threading.Thread(target=prepare_database, name='startup-db', daemon=True)
+    db_thread.start()
+
+    flask_thread = threading.Thread(target=start_flask, name='flask', daemon=True)
+    flask_thread.start()
+
+    assets_thread = threading.Thread(target=prepare_assets, name='startup-assets', daemon=True)
+    assets_thread.start()
 
     # Start Telegram bot in background (non-blocking)
     if TELEGRAM_ENABLED:
-        bot_thread = threading.Thread(target=run_telegram_bot)
-        bot_thread.daemon = True
+        bot_thread = threading.Thread(target=run_telegram_bot, name='telegram-bot', daemon=True)
         bot_thread.start()
 
+    with startup_timer.phase('import webview'):
+        import webview
+
     # Load saved window state or use defaults
-    saved_state = load_window_state()
+    saved_state = window_settings.snapshot()
     width = saved_state.get('width', 1100) if saved_state else 1100
     height = saved_state.get('height', 800) if saved_state else 800
     x = saved_state.get('x', None) if saved_state else None
     y = saved_state.get('y', None) if saved_state else None
 
+    # The page itself doesn't need the database, so open as soon as the port is bound
+    server_ready.wait()
+    startup_timer.mark('window can open')
+
+    if args.profile_startup:
+        db_thread.join()
+        assets_thread.join()
+        startup_timer.report()
+        sys.exit(0)
+
     # Create window with saved size and position
     window = webview.create_window(
         "TaskMaster",
@@ -1177,5 +4571,10 @@ if __name__ == '__main__':
         frameless=False,
         js_api=exit_api  # Add exit API
     )
+    track_window_state(window)
+
+    webview.start(gui='edgechromium')
 
-    webview.start(gui='edgechromium') 
\ No newline at end of file
+    # Window closed: write out any Telegram tasks still being batched, and the window state
+    telegram_ingestor.stop()
+    window_settings.flush()
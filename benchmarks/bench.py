@@ -0,0 +1,490 @@
+"""TaskMaster endpoint benchmarks.
+
+Builds a synthetic todos.db and times every route, through Flask's test
+client or (with --server) a real headless server with concurrent clients:
+
+    python benchmarks/bench.py --tasks 100000
+    python benchmarks/bench.py --tasks 1000000 --server --clients 16
+    python benchmarks/bench.py --tasks 100000 --output new.json --compare baseline.json
+
+Datasets are cached in benchmarks/data/ and copied before every run, since
+the write routes change them. With --compare the run exits with status 1 if
+any endpoint's p50 or p99 got more than --threshold slower than the baseline.
+Peak RSS is the highest resident memory during each case (Linux only).
+"""
+import sys
+import os
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import platform
+import threading
+import subprocess
+import socket
+import http.client
+from collections import deque
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'benchmarks', 'data')
+WORK_DIR = os.path.join(DATA_DIR, 'work')
+RUN_DB = os.path.join(WORK_DIR, 'todos.db')
+
+# Relative --output/--compare paths are taken from where the script was started
+START_DIR = os.getcwd()
+
+# The app reads its database path at import time
+os.environ['TASKMASTER_DB'] = RUN_DB
+os.makedirs(WORK_DIR, exist_ok=True)
+# Keep window_state.json and friends out of the repository
+os.chdir(WORK_DIR)
+sys.path.insert(0, ROOT)
+
+import app as taskmaster
+
+WORDS = [
+    'report', 'invoice', 'meeting', 'review', 'design', 'deploy', 'email', 'call',
+    'budget', 'plan', 'draft', 'client', 'backup', 'fix', 'update', 'research',
+    'groceries', 'gym', 'doctor', 'book', 'flight', 'taxes', 'garden', 'car'
+]
+PRIORITIES = ['low', 'medium', 'high']
+CATEGORIES = ['general', 'work', 'personal', 'shopping', 'health']
+KANBAN_STATUSES = ['todo', 'doing', 'done']
+INSERT_BATCH_SIZE = 10000
+
+# BenchContext for the current run
+CONTEXT = None
+
+# Routes that never finish, shut the app down, are off by default, or start or need a background job
+SKIPPED_ENDPOINTS = {
+    'events', 'exit_app', 'static', 'list_profiles', 'download_profile',
+    'get_job', 'cancel_job', 'export_data', 'import_data', 'download_export'
+}
+
+# ============= DATASET =============
+
+def dataset_path(tasks, seed):
+    return os.path.join(DATA_DIR, f'todos-{tasks}-{seed}.db')
+
+def generate_dataset(path, tasks, seed):
+    """Write a database with `tasks` todos spread over folders, plus notes and archived rows"""
+    rng = random.Random(seed)
+    folders = min(max(5, tasks // 1000), 500)
+    notes = max(10, tasks // 10)
+    now = datetime.now()
+
+    def timestamp():
+        return (now - timedelta(seconds=rng.randrange(2 * 365 * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+
+    def phrase(words):
+        return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+    temp_path = path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    conn = sqlite3.connect(temp_path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    taskmaster.run_migrations(conn)
+
+    conn.executemany('INSERT INTO folders (name, color) VALUES (?, ?)', [
+        ('General' if i == 0 else f'Folder {i}', f'#{rng.randrange(0x1000000):06x}')
+        for i in range(folders)
+    ])
+    conn.commit()
+
+    started = time.perf_counter()
+    for offset in range(0, tasks, INSERT_BATCH_SIZE):
+        rows = []
+        for _ in range(min(INSERT_BATCH_SIZE, tasks - offset)):
+            created = timestamp()
+            completed = rng.random() < 0.4
+            today = rng.random() < 0.02
+            rows.append((
+                phrase(rng.randint(2, 6)).capitalize(),
+                phrase(rng.randint(0, 15)),
+                completed,
+                rng.choice(PRIORITIES),
+                rng.choice(CATEGORIES),
+                rng.randint(1, folders),
+                'done' if completed else rng.choice(KANBAN_STATUSES[:2]),
+                today,
+                created[:10] if today else None,
+                rng.random() < 0.3,
+                created,
+                created
+            ))
+        conn.execute('BEGIN')
+        conn.executemany('''
+            INSERT INTO todos (title, description, completed, priority, category, folder_id, kanban_status,
+                               added_to_today, today_date, archived, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        taskmaster.move_archived_todos(conn.cursor())
+        conn.commit()
+        print(f"  {offset + len(rows)}/{tasks} tasks ({time.perf_counter() - started:.1f}s)", end='\r')
+    print()
+
+    conn.execute('BEGIN')
+    conn.executemany('INSERT INTO notes (content, created_at, updated_at) VALUES (?, ?, ?)', [
+        (phrase(rng.randint(5, 40)), ts, ts) for ts in (timestamp() for _ in range(notes))
+    ])
+    conn.commit()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    os.replace(temp_path, path)
+
+def prepare_run_db(tasks, seed):
+    """Copy the cached dataset (generating it first if needed) to the run database"""
+    path = dataset_path(tasks, seed)
+    if not os.path.exists(path):
+        print(f"Generating {tasks} tasks into {path}")
+        generate_dataset(path, tasks, seed)
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(RUN_DB + suffix):
+            os.remove(RUN_DB + suffix)
+    shutil.copyfile(path, RUN_DB)
+
+    # Datasets cached by older versions are upgraded here rather than inside the first timed request
+    conn = sqlite3.connect(RUN_DB)
+    taskmaster.run_migrations(conn)
+    conn.close()
+
+# ============= CASES =============
+
+class BenchContext:
+    """Ids the write cases operate on; shared by client threads"""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        # Collection path ('/api/todos', ...) -> ids created there during the run
+        self.created = {}
+        self.lock = threading.Lock()
+
+        conn = sqlite3.connect(RUN_DB)
+        self.todo_ids = [r[0] for r in conn.execute('SELECT id FROM todos WHERE archived = 0 ORDER BY random() LIMIT 5000')]
+        self.archived_ids = [r[0] for r in conn.execute('SELECT id FROM todos_archive ORDER BY random() LIMIT 5000')]
+        self.folder_ids = [r[0] for r in conn.execute('SELECT id FROM folders')]
+        conn.close()
+
+    def todo_id(self):
+        with self.lock:
+            return self.rng.choice(self.todo_ids)
+
+    def todo_ids_sample(self, count):
+        with self.lock:
+            return self.rng.sample(self.todo_ids, min(count, len(self.todo_ids)))
+
+    def archived_id(self):
+        with self.lock:
+            return self.rng.choice(self.archived_ids or self.todo_ids)
+
+    def folder_id(self):
+        with self.lock:
+            return self.rng.choice(self.folder_ids)
+
+    def remember_created(self, path, item_id):
+        with self.lock:
+            self.created.setdefault(path, deque()).append(item_id)
+
+    def take_created(self, path, count=1):
+        """Ids made by the create cases, so deletes don't eat into the dataset"""
+        with self.lock:
+            created = self.created.get(path, deque())
+            return [created.popleft() for _ in range(min(count, len(created)))]
+
+def build_cases(ctx):
+    """(name, endpoint, request factory); a factory returns (method, path, json body or None)"""
+    asset_names = sorted(taskmaster.get_assets().files)
+    script = next(name for name in asset_names if name.endswith('.js'))
+
+    def created_todos(count):
+        return ctx.take_created('/api/todos', count) or ctx.todo_ids_sample(count)
+
+    def created_id(path):
+        # 0 (a 404) only if the matching create case was skipped
+        return (ctx.take_created(path) or [0])[0]
+
+    return [
+        ('index', 'index', lambda: ('GET', '/', None)),
+        ('asset js', 'serve_asset', lambda: ('GET', f'/assets/{script}', None)),
+        ('favicon', 'favicon', lambda: ('GET', '/favicon.ico', None)),
+        ('font', 'serve_font', lambda: ('GET', '/mainfont.ttf', None)),
+        ('folders', 'get_folders', lambda: ('GET', '/api/folders', None)),
+        ('todos', 'get_todos', lambda: ('GET', '/api/todos', None)),
+        ('todos page', 'get_todos', lambda: ('GET', '/api/todos?limit=100', None)),
+        ('todos pending', 'get_todos', lambda: ('GET', '/api/todos?status=pending&limit=100', None)),
+        ('todos folder', 'get_todos', lambda: ('GET', f'/api/todos?folder={ctx.folder_id()}', None)),
+        ('todos category', 'get_todos', lambda: ('GET', '/api/todos?category=work&limit=100', None)),
+        ('todos search', 'get_todos', lambda: ('GET', f'/api/todos?search={ctx.rng.choice(WORDS)}&limit=100', None)),
+        ('todos include archived', 'get_todos', lambda: ('GET', '/api/todos?include_archived=true&fields=id,title', None)),
+        ('today', 'get_today_todos', lambda: ('GET', '/api/todos/today', None)),
+        ('archived', 'get_archived_todos', lambda: ('GET', '/api/todos/archived?limit=100', None)),
+        ('search', 'search', lambda: ('GET', f'/api/search?q={ctx.rng.choice(WORDS)}', None)),
+        ('notes', 'get_notes', lambda: ('GET', '/api/notes', None)),
+        ('stats', 'get_stats', lambda: ('GET', '/api/stats', None)),
+        ('telegram status', 'telegram_status', lambda: ('GET', '/api/telegram/status', None)),
+        ('create todo', 'create_todo', lambda: ('POST', '/api/todos', {
+            'title': f'Bench {ctx.rng.choice(WORDS)}', 'folder_id': ctx.folder_id(), 'priority': ctx.rng.choice(PRIORITIES)
+        })),
+        ('update todo', 'update_todo', lambda: ('PUT', f'/api/todos/{ctx.todo_id()}', {'priority': ctx.rng.choice(PRIORITIES)})),
+        ('toggle todo', 'toggle_todo', lambda: ('PUT', f'/api/todos/{ctx.todo_id()}/toggle', None)),
+        ('kanban status', 'update_kanban_status', lambda: ('PUT', f'/api/todos/{ctx.todo_id()}/kanban-status', {'status': ctx.rng.choice(KANBAN_STATUSES)})),
+        ('add to today', 'add_to_today', lambda: ('PUT', f'/api/todos/{ctx.todo_id()}/add-to-today', None)),
+        ('remove from today', 'remove_from_today', lambda: ('PUT', f'/api/todos/{ctx.todo_id()}/remove-from-today', None)),
+        ('archive', 'archive_todo', lambda: ('PUT', f'/api/todos/{ctx.todo_id()}/archive', None)),
+        ('unarchive', 'unarchive_todo', lambda: ('PUT', f'/api/todos/{ctx.archived_id()}/unarchive', None)),
+        ('batch kanban status', 'batch_update_kanban_status', lambda: ('PUT', '/api/todos/batch/kanban-status', {
+            'ids': ctx.todo_ids_sample(50), 'status': ctx.rng.choice(KANBAN_STATUSES)
+        })),
+        ('batch move', 'batch_move_todos', lambda: ('PUT', '/api/todos/batch/move', {'ids': ctx.todo_ids_sample(50), 'folder_id': ctx.folder_id()})),
+        ('batch patch', 'batch_patch_todos', lambda: ('PATCH', '/api/todos/batch', [
+            {'id': todo_id, 'priority': ctx.rng.choice(PRIORITIES)} for todo_id in ctx.todo_ids_sample(50)
+        ])),
+        ('delete todo', 'delete_todo', lambda: ('DELETE', f'/api/todos/{created_todos(1)[0]}', None)),
+        ('batch delete', 'batch_delete_todos', lambda: ('DELETE', '/api/todos/batch', {'ids': created_todos(10)})),
+        ('create folder', 'create_folder', lambda: ('POST', '/api/folders', {'name': f'Bench {ctx.rng.randrange(10 ** 6)}'})),
+        ('delete folder', 'delete_folder', lambda: ('DELETE', f"/api/folders/{created_id('/api/folders')}", None)),
+        ('create note', 'create_note', lambda: ('POST', '/api/notes', {'content': f'Bench note {ctx.rng.choice(WORDS)}'})),
+        ('delete note', 'delete_note', lambda: ('DELETE', f"/api/notes/{created_id('/api/notes')}", None)),
+        ('window state', 'save_window_state_api', lambda: ('POST', '/api/window-state', {'width': 1100, 'height': 800, 'x': 10, 'y': 10})),
+        ('telegram import', 'import_telegram_tasks', lambda: ('POST', '/api/telegram/import', None)),
+        ('jobs', 'list_jobs', lambda: ('GET', '/api/jobs', None)),
+        ('metrics', 'get_metrics', lambda: ('GET', '/api/metrics', None)),
+        ('maintenance reports', 'maintenance_reports', lambda: ('GET', '/api/debug/maintenance', None)),
+    ]
+
+def uncovered_endpoints(cases):
+    covered = {endpoint for _, endpoint, _ in cases}
+    return sorted({rule.endpoint for rule in taskmaster.app.url_map.iter_rules()} - covered - SKIPPED_ENDPOINTS)
+
+# ============= MEASUREMENT =============
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+def reset_peak_rss(pid=None):
+    """Restart peak-memory tracking for `pid` (default: this process) at its current RSS.
+
+    Linux only; returns False elsewhere, where the lifetime peak can't be reset
+    and so says nothing about a single case.
+    """
+    try:
+        with open(f'/proc/{pid or os.getpid()}/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_kb(pid=None):
+    """Peak resident memory of `pid` (default: this process) since reset_peak_rss()"""
+    try:
+        with open(f'/proc/{pid or os.getpid()}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+def summarize(latencies, errors, wall_seconds, rss_kb):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / wall_seconds, 1),
+        'peak_rss_kb': rss_kb
+    }
+
+def run_test_client(cases, iterations, warmup, cold_cache):
+    """Time each case sequentially through Flask's test client"""
+    client = taskmaster.app.test_client()
+    results = {}
+
+    def call(factory):
+        method, path, body = factory()
+        if cold_cache:
+            taskmaster.response_cache.invalidate()
+        started = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        response.close()
+        if method == 'POST' and response.status_code == 201:
+            CONTEXT.remember_created(path, response.get_json()['id'])
+        return elapsed, response.status_code
+
+    for name, _, factory in cases:
+        for _ in range(warmup):
+            call(factory)
+        latencies, errors = [], 0
+        tracked = reset_peak_rss()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            elapsed, status = call(factory)
+            latencies.append(elapsed)
+            errors += status >= 400
+        results[name] = summarize(latencies, errors, time.perf_counter() - started,
+                                  peak_rss_kb() if tracked else None)
+        print_result(name, results[name])
+    return results
+
+def run_server(cases, iterations, warmup, clients, threads, port):
+    """Time each case against `app.py --headless` with concurrent keep-alive clients"""
+    env = dict(os.environ, TASKMASTER_DB=RUN_DB)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'app.py'), '--headless', '--port', str(port), '--threads', str(threads)],
+        cwd=WORK_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('Server did not start')
+                time.sleep(0.1)
+
+        results = {}
+        for name, _, factory in cases:
+            latencies, errors = [], [0]
+            lock = threading.Lock()
+            per_client = max(1, iterations // clients)
+
+            def client_loop(count):
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                local = []
+                local_errors = 0
+                for i in range(count + warmup):
+                    method, path, body = factory()
+                    payload = json.dumps(body) if body is not None else None
+                    headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'} if payload else {'Accept-Encoding': 'gzip'}
+                    started = time.perf_counter()
+                    conn.request(method, path, body=payload, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                    elapsed = time.perf_counter() - started
+                    if method == 'POST' and response.status == 201:
+                        CONTEXT.remember_created(path, json.loads(data)['id'])
+                    if i >= warmup:
+                        local.append(elapsed)
+                        local_errors += response.status >= 400
+                conn.close()
+                with lock:
+                    latencies.extend(local)
+                    errors[0] += local_errors
+
+            workers = [threading.Thread(target=client_loop, args=(per_client,)) for _ in range(clients)]
+            tracked = reset_peak_rss(server.pid)
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            results[name] = summarize(latencies, errors[0], time.perf_counter() - started,
+                                      peak_rss_kb(server.pid) if tracked else None)
+            print_result(name, results[name])
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+def print_result(name, result):
+    rss = f"{result['peak_rss_kb'] // 1024}MB" if result['peak_rss_kb'] else '-'
+    print(f"{name:<24} p50 {result['p50_ms']:>9.2f}ms  p99 {result['p99_ms']:>9.2f}ms  "
+          f"{result['throughput_rps']:>9.1f} req/s  rss {rss:>6}  errors {result['errors']}")
+
+# ============= COMPARISON =============
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """(case, metric, old, new) for every latency that got worse than allowed"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if result[metric] > old[metric] * (1 + threshold) and result[metric] - old[metric] > min_delta_ms:
+                regressions.append((name, metric, old[metric], result[metric]))
+    return regressions
+
+def main():
+    global CONTEXT
+
+    parser = argparse.ArgumentParser(description='Benchmark TaskMaster endpoints')
+    parser.add_argument('--tasks', type=int, default=1000, help='Dataset size, e.g. 1000, 100000 or 1000000')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the dataset and requests')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per endpoint (per client with --server)')
+    parser.add_argument('--cold-cache', action='store_true', help='Empty the response cache before every request')
+    parser.add_argument('--only', help='Comma-separated case names to run')
+    parser.add_argument('--server', action='store_true', help='Run against app.py --headless instead of the test client')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent clients with --server')
+    parser.add_argument('--threads', type=int, default=16, help='Server worker threads with --server')
+    parser.add_argument('--port', type=int, default=5099, help='Server port with --server')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown vs the baseline (0.2 = 20%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='Ignore slowdowns smaller than this')
+    args = parser.parse_args()
+
+    prepare_run_db(args.tasks, args.seed)
+    taskmaster.ensure_db()
+    CONTEXT = BenchContext(args.seed)
+
+    cases = build_cases(CONTEXT)
+    if args.only:
+        wanted = set(args.only.split(','))
+        cases = [case for case in cases if case[0] in wanted]
+    missing = uncovered_endpoints(build_cases(CONTEXT))
+    if missing:
+        print(f"⚠️ No benchmark case for: {', '.join(missing)}")
+
+    mode = f'server ({args.clients} clients, {args.threads} threads)' if args.server else 'test client'
+    print(f"Benchmarking {len(cases)} cases on {args.tasks} tasks through the {mode}")
+    if args.server:
+        taskmaster.db_pool.close_all()
+        results = run_server(cases, args.iterations, args.warmup, args.clients, args.threads, args.port)
+    else:
+        results = run_test_client(cases, args.iterations, args.warmup, args.cold_cache)
+
+    report = {
+        'meta': {
+            'tasks': args.tasks,
+            'seed': args.seed,
+            'iterations': args.iterations,
+            'mode': 'server' if args.server else 'test_client',
+            'clients': args.clients if args.server else 1,
+            'cold_cache': args.cold_cache,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'timestamp': datetime.now().isoformat(timespec='seconds')
+        },
+        'results': results
+    }
+    if args.output:
+        with open(os.path.join(START_DIR, args.output), 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(os.path.join(START_DIR, args.compare)) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for name, metric, old, new in regressions:
+            print(f"❌ {name} {metric}: {old:.2f}ms -> {new:.2f}ms")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No endpoint more than {args.threshold:.0%} slower than {args.compare}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Query plans of the hot queries, and the triggers that keep counters and search in sync.
+
+Every test runs the migrations on a fresh database file:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app reads its database path at import time; these tests open their own
+os.environ.setdefault('TASKMASTER_DB', os.path.join(tempfile.gettempdir(), 'taskmaster-tests.db'))
+sys.path.insert(0, ROOT)
+
+import app as taskmaster
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'todos.db')
+    taskmaster.run_migrations(conn)
+    conn.executemany('INSERT INTO folders (id, name) VALUES (?, ?)', [(1, 'General'), (2, 'Work')])
+    conn.commit()
+    yield conn
+    conn.close()
+
+def fts_available(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'todos_fts'").fetchone() is not None
+
+def add_todo(conn, title, folder_id=1, completed=0, priority='medium', category='general', description=None):
+    cursor = conn.execute('''
+        INSERT INTO todos (title, description, completed, priority, category, folder_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (title, description, completed, priority, category, folder_id))
+    return cursor.lastrowid
+
+def write(conn, sql, params=()):
+    """Update or delete through the app's helper, which also moves rows between tables"""
+    taskmaster.write_todos(conn.cursor(), sql, params)
+
+def folder_counters(conn):
+    return {
+        folder_id: (todo_count, completed_count)
+        for folder_id, todo_count, completed_count in conn.execute('SELECT * FROM folder_counters')
+        if todo_count or completed_count
+    }
+
+def counted_folders(conn):
+    return {
+        folder_id: (todo_count, completed_count)
+        for folder_id, todo_count, completed_count in conn.execute('''
+            SELECT folder_id, COUNT(*), SUM(completed = 1) FROM all_todos
+            WHERE folder_id IS NOT NULL GROUP BY folder_id
+        ''')
+    }
+
+def todo_stats(conn):
+    return {(dimension, key): count for dimension, key, count in conn.execute('SELECT * FROM todo_stats') if count}
+
+def counted_stats(conn):
+    rows = conn.execute('''
+        SELECT 'status', 'total', COUNT(*) FROM all_todos
+        UNION ALL
+        SELECT 'status', 'completed', COUNT(*) FROM all_todos WHERE completed = 1
+        UNION ALL
+        SELECT 'status', 'pending', COUNT(*) FROM all_todos WHERE completed = 0
+        UNION ALL
+        SELECT 'priority', COALESCE(priority, ''), COUNT(*) FROM all_todos GROUP BY 2
+        UNION ALL
+        SELECT 'category', COALESCE(category, ''), COUNT(*) FROM all_todos GROUP BY 2
+    ''')
+    return {(dimension, key): count for dimension, key, count in rows if count}
+
+def assert_counters_match(conn):
+    assert folder_counters(conn) == counted_folders(conn)
+    assert todo_stats(conn) == counted_stats(conn)
+
+def search(conn, table, word):
+    return {row[0] for row in conn.execute(f'SELECT rowid FROM {table} WHERE {table} MATCH ?', (f'"{word}"',))}
+
+# ============= QUERY PLANS =============
+
+def test_migrations_reach_latest_version(conn):
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(taskmaster.MIGRATIONS)
+
+def test_hot_queries_do_not_scan_todo_tables(conn):
+    taskmaster.FTS_ENABLED = fts_available(conn)
+    assert taskmaster.check_query_plans(conn) == []
+
+@pytest.mark.parametrize('name, index', [
+    ('todos page', 'idx_todos_archived_created'),
+    ('todos pending', 'idx_todos_archived_completed_created'),
+    ('todos folder', 'idx_todos_folder_archived_created'),
+    ('todos category', 'idx_todos_category_archived_created'),
+    ('today', 'idx_todos_today'),
+    ('archived', 'idx_todos_archive_updated'),
+    ('unarchive moves', 'idx_todos_archive_unarchived'),
+    ('folder archive delete', 'idx_todos_archive_folder')
+])
+def test_hot_query_uses_index(conn, name, index):
+    queries = {query_name: (query, params) for query_name, query, params in taskmaster.hot_queries()}
+    query, params = queries[name]
+    plan = ' | '.join(step[3] for step in conn.execute(f'EXPLAIN QUERY PLAN {query}', params))
+    assert index in plan
+
+# ============= TRIGGERS =============
+
+def test_counters_follow_inserts(conn):
+    add_todo(conn, 'one')
+    add_todo(conn, 'two', completed=1, priority='high')
+    add_todo(conn, 'three', folder_id=2, category='work')
+    assert folder_counters(conn) == {1: (2, 1), 2: (1, 0)}
+    assert todo_stats(conn)[('status', 'total')] == 3
+    assert_counters_match(conn)
+
+def test_counters_follow_updates(conn):
+    todo_id = add_todo(conn, 'one')
+    add_todo(conn, 'two')
+    write(conn, 'UPDATE {table} SET completed = 1 WHERE id = ?', (todo_id,))
+    write(conn, 'UPDATE {table} SET folder_id = 2, priority = ?, category = ? WHERE id = ?', ('low', 'work', todo_id))
+    assert folder_counters(conn) == {1: (1, 0), 2: (1, 1)}
+    assert todo_stats(conn)[('priority', 'low')] == 1
+    assert_counters_match(conn)
+
+def test_counters_follow_deletes(conn):
+    todo_id = add_todo(conn, 'one', completed=1)
+    add_todo(conn, 'two')
+    write(conn, 'DELETE FROM {table} WHERE id = ?', (todo_id,))
+    assert folder_counters(conn) == {1: (1, 0)}
+    assert_counters_match(conn)
+
+def test_archiving_moves_rows_without_changing_counters(conn):
+    todo_id = add_todo(conn, 'one')
+    add_todo(conn, 'two')
+    before = folder_counters(conn), todo_stats(conn)
+
+    write(conn, 'UPDATE {table} SET archived = 1 WHERE id = ?', (todo_id,))
+    assert conn.execute('SELECT COUNT(*) FROM todos_archive WHERE id = ?', (todo_id,)).fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM todos WHERE id = ?', (todo_id,)).fetchone()[0] == 0
+    assert (folder_counters(conn), todo_stats(conn)) == before
+
+    # Completing and deleting an archived row still counts
+    write(conn, 'UPDATE {table} SET completed = 1 WHERE id = ?', (todo_id,))
+    assert folder_counters(conn) == {1: (2, 1)}
+    write(conn, 'UPDATE {table} SET archived = 0 WHERE id = ?', (todo_id,))
+    assert conn.execute('SELECT COUNT(*) FROM todos WHERE id = ?', (todo_id,)).fetchone()[0] == 1
+    assert_counters_match(conn)
+    write(conn, 'UPDATE {table} SET archived = 1 WHERE id = ?', (todo_id,))
+    write(conn, 'DELETE FROM {table} WHERE id = ?', (todo_id,))
+    assert folder_counters(conn) == {1: (1, 0)}
+    assert_counters_match(conn)
+
+def test_search_index_follows_changes(conn):
+    if not fts_available(conn):
+        pytest.skip('SQLite built without FTS5')
+    todo_id = add_todo(conn, 'alpha report', description='quarterly')
+    assert search(conn, 'todos_fts', 'alpha') == {todo_id}
+    assert search(conn, 'todos_fts', 'quarterly') == {todo_id}
+
+    write(conn, 'UPDATE {table} SET title = ? WHERE id = ?', ('beta report', todo_id))
+    assert search(conn, 'todos_fts', 'alpha') == set()
+    assert search(conn, 'todos_fts', 'beta') == {todo_id}
+
+    write(conn, 'UPDATE {table} SET archived = 1 WHERE id = ?', (todo_id,))
+    assert search(conn, 'todos_fts', 'beta') == set()
+    assert search(conn, 'todos_archive_fts', 'beta') == {todo_id}
+
+    write(conn, 'UPDATE {table} SET title = ? WHERE id = ?', ('gamma report', todo_id))
+    assert search(conn, 'todos_archive_fts', 'beta') == set()
+    assert search(conn, 'todos_archive_fts', 'gamma') == {todo_id}
+
+    write(conn, 'DELETE FROM {table} WHERE id = ?', (todo_id,))
+    assert search(conn, 'todos_archive_fts', 'gamma') == set()
+    assert search(conn, 'todos_fts', 'report') == set()